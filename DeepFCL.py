@@ -432,6 +432,8 @@ import matplotlib.pyplot as plt
 import tensorflow as tf
 
 import os
+import data
+import dataset
 #import tensorflow.contrib.slim as slim
 
 class DeepFCL:
@@ -563,10 +565,10 @@ class DeepFCL:
     def learn(self, observations, actions, pre_actions):
         
         # Prepre Training Data -------------------------------------------
-        # normalize observation input
-        self.mean_obs = np.mean(observations, axis=0, keepdims=True)
-        self.std_obs = np.std(observations, ddof=1)
-        observations = (observations - self.mean_obs) / self.std_obs
+        # normalize observation input, batch by batch below so that packed
+        # or memory-mapped observations (data.PackedObservations,
+        # dataset.Dataset) are only read per batch
+        self.mean_obs, self.std_obs = dataset.getStats(observations)
         
         # number of samples in total
         num_samples = observations.shape[0] - 1
@@ -601,7 +603,7 @@ class DeepFCL:
                 
                 for i, batch in enumerated_minibatches:                    
                     _ , tmp_loss = sess.run([self.train_op,self.loss], feed_dict = {
-                                                                        self.obs_var: observations[batch],                                                                        
+                                                                        self.obs_var: dataset.normalize(observations[batch], self.mean_obs, self.std_obs),
                                                                         self.targetOut: actions[batch],
                                                                         self.pre_ctrl: pre_actions[batch] })                                                                      
                     epoch_loss += tmp_loss
@@ -615,8 +617,13 @@ class DeepFCL:
             # save the updated model
             print('saving learned model')
             self.saver.save(sess, os.path.join(self.save_path, 'model_epi' + str(epoch)))
-            predicted_action = sess.run(self.out, feed_dict={self.obs_var: observations,
-                                                             self.pre_ctrl: pre_actions[batch] })
+            predicted_action = []
+            for start in range(0, len(observations), self.batchsize):
+                chunk = np.arange(start, min(start + self.batchsize, len(observations)))
+                predicted_action.append(sess.run(self.out, feed_dict={
+                        self.obs_var: dataset.normalize(observations[chunk], self.mean_obs, self.std_obs),
+                        self.pre_ctrl: pre_actions[chunk] }))
+            predicted_action = np.concatenate(predicted_action, axis=0)
         plt.close("Learned Policy")
         
         return predicted_action, loss_hist
@@ -653,12 +660,15 @@ if __name__ == '__main__':
     print('\nFormation Control Task\n')
 
     print('Loading and displaying training data ... ')
-    training_data = np.load('fcl_data11.npz')
+    # The .npz is converted once to memory-mapped .npy shards
+    if not os.path.exists('fcl_data11'):
+        dataset.convert('fcl_data11.npz', 'fcl_data11')
+    training_data = dataset.Dataset('fcl_data11')
     #plot_observations(training_data['observations'], name="Observation Samples (Subset of Training Data) -- Simple Navigation Task")
 
     print('Learning a policy ... ')
     fcl = DeepFCL(50, 50, 2, 1)
-    [training_ctrls, loss_hist] = fcl.learn(training_data['observations'],training_data['actions'],training_data['epi_starts'])
+    [training_ctrls, loss_hist] = fcl.learn(data.getObservations(training_data),training_data['actions'],training_data['epi_starts'])
 #    plot_representation(training_states, training_data['rewards'],
 #                            name='Observation-State-Mapping Applied to Training Data -- Simple Navigation Task',
 #                            add_colorbar=True)
@@ -13,6 +13,7 @@ import matplotlib.pyplot as plt
 import tensorflow as tf
 
 import os
+import dataset
 #import tensorflow.contrib.slim as slim
 
 class DeepFCL:
@@ -106,16 +107,15 @@ class DeepFCL:
     def learn(self, observations, actions, pre_actions, epi_starts):
         
         # Prepre Training Data -------------------------------------------
-        # normalize observation input
-        self.mean_obs = np.mean(observations, axis=0, keepdims=True)
-        self.std_obs = np.std(observations, ddof=1)
-        observations = (observations - self.mean_obs) / self.std_obs
+        # normalize observation input, batch by batch below so that
+        # memory-mapped observations (dataset.Dataset) are only read per batch
+        self.mean_obs, self.std_obs = dataset.getStats(observations)
         
         # number of samples in total
         num_samples = observations.shape[0] - 1
         
         # indices for all time steps where the episode continues
-        indices = np.array([i for i in range(num_samples) if not epi_starts[i + 1]], dtype='int32')
+        indices = np.flatnonzero(~np.asarray(epi_starts[1:num_samples + 1], dtype=bool)).astype('int32')
         np.random.shuffle(indices)
 
         # split indices into minibatches
@@ -143,7 +143,7 @@ class DeepFCL:
                 
                 for i, batch in enumerated_minibatches:                    
                     _ , tmp_loss = sess.run([self.train_op,self.loss], feed_dict = {
-                                                                        self.obs_var: observations[batch],                                                                        
+                                                                        self.obs_var: dataset.normalize(observations[batch], self.mean_obs, self.std_obs),
                                                                         self.targetOut: actions[batch] })                                                                      
                     epoch_loss += tmp_loss
                     epoch_batches += 1                    
@@ -156,8 +156,13 @@ class DeepFCL:
             # save the updated model
             print('saving learned model')
             self.saver.save(sess, os.path.join(self.save_path, 'model_epi' + str(epoch)))
-            predicted_action = sess.run(self.out, feed_dict={self.obs_var: observations,
-                                                             self.pre_ctrl: pre_actions })
+            predicted_action = []
+            for start in range(0, len(observations), self.batchsize):
+                chunk = np.arange(start, min(start + self.batchsize, len(observations)))
+                predicted_action.append(sess.run(self.out, feed_dict={
+                        self.obs_var: dataset.normalize(observations[chunk], self.mean_obs, self.std_obs),
+                        self.pre_ctrl: pre_actions[chunk] }))
+            predicted_action = np.concatenate(predicted_action, axis=0)
         plt.close("Learned Policy")
         
         return predicted_action, loss_hist
@@ -194,7 +199,10 @@ if __name__ == '__main__':
     print('\nFormation Control Task\n')
 
     print('Loading and displaying training data ... ')
-    training_data = np.load('fcl_data11.npz')
+    # The .npz is converted once to memory-mapped .npy shards
+    if not os.path.exists('fcl_data11'):
+        dataset.convert('fcl_data11.npz', 'fcl_data11')
+    training_data = dataset.Dataset('fcl_data11')
     #plot_observations(training_data['observations'], name="Observation Samples (Subset of Training Data) -- Simple Navigation Task")
 
     print('Learning a policy ... ')
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:12:37 2026
+
+Headless simulator that advances E independent episodes of the same robot
+team at once. Robot states live in SwarmState arrays of shape (E, N) and
+every step is one batched update, so generating many offline episodes for
+the data sets does not go through a full Scene per episode.
+
+Only the reference-velocity distance formation (dynamics 17 and 18) is
+covered, which is what the test5_* data generation scripts use. Random
+numbers are drawn from the random module in the same order as initRef()
+and Scene.resetPosition() of those scripts. With reset(seed) episode e is
+drawn after random.seed(seed + e), as runner.runEpisode() does, so it
+reproduces episode e of a runner run with the same base seed.
+
+The arrays take the types of the Scene run like in swarmstate.py (the
+float32 formation of the drivers makes most of them float32), so that an
+episode is the same to the last bit as the Scene run, see checkEpisode().
+
+There is no sensor offline, so getData() has no observation columns.
+
+@author: cz
+"""
+
+import numpy as np
+import math
+import random
+from swarmstate import SwarmState, commonType, cast, power
+import swarmcontrol
+
+class BatchSimulator():
+    def __init__(self, numEpisodes, formation, adjMatrix, roles = None,
+                 dynamics = 18, dt = 0.01, recordData = False,
+                 integrator = 'euler', integratorDt = None):
+        # formation: (N, 3) desired [x, y, theta] of every robot, i.e. the
+        # second row of the argument of Scene.addRobot
+        self.numEpisodes = numEpisodes
+        # np.float32 like the argument of Scene.addRobot in the drivers
+        self.formation = np.asarray(formation)
+        if self.formation.dtype.kind != 'f':
+            self.formation = self.formation.astype(np.float64)
+        self.robotNum = self.formation.shape[0]
+        self.adjMatrix = np.asarray(adjMatrix)
+        if roles is None:
+            roles = [swarmcontrol.ROLE_PEER] * self.robotNum
+        self.roles = np.asarray(roles)
+        if dynamics != 17 and dynamics != 18:
+            raise Exception("Undefined robot dynamics for batch simulation", dynamics)
+        self.dynamics = dynamics
+        self.dt = dt
+        self.integrator = integrator
+        self.integratorDt = integratorDt
+        self.recordData = recordData
+        self.neighborLists = [np.flatnonzero(self.adjMatrix[i]).tolist()
+                              for i in range(self.robotNum)]
+
+        shape = (numEpisodes, self.robotNum)
+        self.xi = SwarmState(shape, dynamics)
+        self.xid = SwarmState(shape, dynamics)
+        self.v1Desired = np.zeros(shape)
+        self.v2Desired = np.zeros(shape)
+        self.t = 0
+        self.ts = []
+
+        # Reference of every episode, shape (E, 1)
+        self.vRefMag = np.zeros((numEpisodes, 1))
+        self.vRefAng = np.zeros((numEpisodes, 1))
+        self.alpha = np.ones((numEpisodes, 1))
+        self.dpbarx = np.zeros((numEpisodes, 1))
+        self.dpbary = np.zeros((numEpisodes, 1))
+        self.records = {'obs2': [], 'dstars': [], 'actions': []}
+
+    def reset(self, radius = 4, vRefMag = 0.7, alphaList = [1.5], minDistance = 1,
+              seed = None):
+        # Draw the reference and the initial positions of every episode, in
+        # the same order as initRef() followed by Scene.resetPosition(radius).
+        # With a seed every episode e starts from random.seed(seed + e),
+        # otherwise all episodes continue the current random stream.
+        self.t = 0
+        self.ts = []
+        shape = (self.numEpisodes, self.robotNum)
+        self.xi = SwarmState(shape, self.dynamics)
+        self.xid = SwarmState(shape, self.dynamics)
+        for e in range(self.numEpisodes):
+            if seed is not None:
+                random.seed(seed + e)
+            self.vRefMag[e, 0] = vRefMag
+            self.vRefAng[e, 0] = 2 * math.pi * random.random()
+            self.alpha[e, 0] = random.choice(alphaList)
+            xs = []
+            ys = []
+            for i in range(self.robotNum):
+                while True:
+                    minDij = float("inf")
+                    alpha1 = math.pi * (2 * random.random()) # arbitrary
+                    rho1 = radius * random.random()
+                    x1 = rho1 * math.cos(alpha1)
+                    y1 = rho1 * math.sin(alpha1)
+                    theta1 = 2 * math.pi * random.random()
+                    for j in range(0, i):
+                        dij = ((x1 - xs[j])**2 + (y1 - ys[j])**2)**0.5
+                        if dij < minDij:
+                            minDij = dij
+                    if minDij >= minDistance:
+                        break
+                xs.append(x1)
+                ys.append(y1)
+                self.xi.theta[e, i] = theta1
+            self.xi.x[e, :] = xs
+            self.xi.y[e, :] = ys
+        # Desired formation, scaled as in Scene.scaleDesiredFormation()
+        dtype = self.formation.dtype
+        self.xid.x = self.formation[:, 0] * cast(self.alpha, dtype)
+        self.xid.y = self.formation[:, 1] * cast(self.alpha, dtype)
+        self.xid.theta = np.broadcast_to(self.formation[:, 2], shape).copy()
+        self.v1Desired[...] = 0
+        self.v2Desired[...] = 0
+        self.records = {'obs2': [], 'dstars': [], 'actions': []}
+
+    def step(self):
+        # One step of Scene.simulate() for every episode
+        self.t += self.dt
+        self.ts.append(self.t)
+        # Scene.propagateXid()
+        omega = 0
+        self.dpbarx[...] = -self.vRefMag * np.cos(self.vRefAng + self.t * omega)
+        self.dpbary[...] = -self.vRefMag * np.sin(self.vRefAng + self.t * omega)
+        # Robot.precompute(), then Robot.propagateDesired()
+        self.xi.transform()
+        self.xid.transform()
+        self.xid.theta = np.broadcast_to(self.vRefAng, self.xid.x.shape).copy()
+        # Robot.control()
+        v1, v2 = swarmcontrol.control(self.xi, self.xid, self.adjMatrix,
+                                      self.roles, self.dynamics, self.alpha,
+                                      self.dpbarx, self.dpbary)
+        v1, v2 = swarmcontrol.limitAcceleration(v1, v2, self.v1Desired,
+                                                self.v2Desired, self.dt)
+        self.v1Desired = v1
+        self.v2Desired = v2
+        if self.recordData:
+            self.record()
+        # State.propagate()
+        self.xi.propagate(v1, v2, self.dt, self.integrator, self.integratorDt)
+
+    def run(self, tf):
+        while self.t <= tf:
+            self.step()
+
+    def record(self):
+        # The obs2 and actions rows Data.add() writes for every robot, kept as
+        # one (E, N, ...) array per step until getData()
+        dtype = commonType(self.xid.theta, self.xi.theta)
+        psi = cast(self.xid.theta, dtype) - cast(self.xi.theta, dtype)
+        psi = np.where(psi > math.pi, psi - 2 * math.pi, psi)
+        psi = np.where(psi < -math.pi, psi + 2 * math.pi, psi)
+        dpbar = power(power(self.dpbarx, 2) + power(self.dpbary, 2), 0.5)
+        dpbar = np.broadcast_to(dpbar, psi.shape)
+        alpha = np.broadcast_to(self.alpha, psi.shape)
+        self.records['obs2'].append(np.stack((dpbar, psi, alpha, self.xi.x,
+                                              self.xi.y, self.xi.theta), axis = -1))
+        if self.dynamics == 17:
+            dxp = self.xid.xp[..., :, None] - self.xid.xp[..., None, :]
+            dyp = self.xid.yp[..., :, None] - self.xid.yp[..., None, :]
+            self.records['dstars'].append(power(power(dxp, 2) + power(dyp, 2), 0.5))
+        self.records['actions'].append(np.stack((self.v1Desired, self.v2Desired),
+                                                axis = -1))
+
+    def getData(self, e):
+        # Per-robot dicts with the keys of Data.d for episode e, except the
+        # sensor observations ('observations', 'observations1'), which do not
+        # exist offline. The rows are joined to the empty arrays of
+        # Data.__init__ in one go, so the dtypes come out as with Data.add().
+        dataList = []
+        T = len(self.records['actions'])
+        obs2All = np.array([obs2[e] for obs2 in self.records['obs2']]).reshape((T, self.robotNum, 6))
+        actionsAll = np.array([actions[e] for actions in self.records['actions']]).reshape((T, self.robotNum, 2))
+        if self.dynamics == 17:
+            dstarsAll = np.array([dstars[e] for dstars in self.records['dstars']])
+        for i in range(self.robotNum):
+            epiStarts = np.zeros(T, dtype = bool)
+            epiStarts[0:1] = True
+            obs2 = obs2All[:, i, :]
+            if self.dynamics == 17:
+                obs2 = np.concatenate((obs2, dstarsAll[:, i, self.neighborLists[i]]
+                                       .reshape((T, -1))), axis = 1)
+            actions = actionsAll[:, i, :]
+            d = dict()
+            d['epi_starts'] = np.append(np.array([], dtype = bool), epiStarts)
+            d['obs2'] = np.append(np.zeros((0, obs2.shape[1]), dtype = np.float32),
+                                  obs2, axis = 0)
+            d['actions'] = np.append(np.zeros((0, 2), dtype = np.float32),
+                                     actions, axis = 0)
+            dataList.append(d)
+        return dataList
+
+    def checkEpisode(self, e, scene):
+        # Raise if episode e differs in any bit or in type from scene, a Scene
+        # run of the same episode to the same time (generateData() of the
+        # test5_* scripts after random.seed(seed + e))
+        if scene.t != self.t:
+            raise Exception('Episode is not at the time of the Scene run', e, self.t, scene.t)
+        for robot in scene.robots:
+            i = robot.index
+            values = [('x', robot.xi.x, self.xi.x[e, i]),
+                      ('y', robot.xi.y, self.xi.y[e, i]),
+                      ('theta', robot.xi.theta, self.xi.theta[e, i]),
+                      ('v1Desired', robot.v1Desired, self.v1Desired[e, i]),
+                      ('v2Desired', robot.v2Desired, self.v2Desired[e, i])]
+            for name, value, batchValue in values:
+                if np.asarray(value).dtype != batchValue.dtype or value != batchValue:
+                    raise Exception('Episode differs from the Scene run in ' + name,
+                                    e, i, batchValue, value)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:36:09 2026
+
+Convergence detector for ending an episode early. It is fed once per step
+with the separation error of every formation edge and the velocity of every
+robot. The formation is considered converged once the largest absolute
+edge error and the largest deviation of a robot's velocity from the mean
+velocity of the team have both stayed within their tolerances for dwellTime
+seconds.
+
+@author: cz
+"""
+
+import numpy as np
+
+class ConvergenceMonitor():
+    def __init__(self, errorTol = 0.01, velocityTol = 0.01, dwellTime = 1.0,
+                 tMin = 1.0):
+        self.errorTol = errorTol # m
+        self.velocityTol = velocityTol # m/s
+        self.dwellTime = dwellTime # s
+        self.tMin = tMin # no convergence is reported before this time
+        self.reset()
+
+    def reset(self):
+        self.settledSince = None
+        self.converged = False
+        self.maxAbsError = float('inf')
+        self.maxVelocityError = float('inf')
+
+    def update(self, t, errors, vx, vy):
+        # errors: (|E|,) edge separation errors; vx, vy: (N,) robot velocities
+        self.maxAbsError = float(np.max(np.fabs(errors))) if len(errors) else 0.0
+        dvx = vx - np.mean(vx)
+        dvy = vy - np.mean(vy)
+        self.maxVelocityError = float(np.max((dvx**2 + dvy**2)**0.5))
+        if (self.maxAbsError <= self.errorTol and
+            self.maxVelocityError <= self.velocityTol):
+            if self.settledSince is None:
+                self.settledSince = t
+        else:
+            self.settledSince = None
+        self.converged = (t >= self.tMin and self.settledSince is not None and
+                          t - self.settledSince >= self.dwellTime)
+        return self.converged
@@ -8,6 +8,102 @@ import numpy as np
 import os
 import queue
 import math
+import runindex
+
+OBSERVATIONS_PACKED = 'observations_packed'
+# Number of cells (hPix * wPix) of every packed row, kept as a column so that
+# the rows can be unpacked to the right length
+OBSERVATIONS_LENGTH = 'observations_length'
+
+def packObservations(observations):
+    # Binary occupancy maps (0 or 255 per cell) with one bit per cell, (n, L)
+    # uint8 -> (n, ceil(L / 8)) uint8
+    return np.packbits(np.asarray(observations) != 0, axis = 1)
+
+def unpackObservations(packed, length):
+    # Inverse of packObservations(), cells come back as 0 or 255 (uint8)
+    return np.unpackbits(packed, axis = 1, count = length) * np.uint8(255)
+
+class PackedObservations():
+    # Read-only (n, L) view of packed occupancy maps. Only the rows that are
+    # indexed are unpacked, so training can go through it batch by batch.
+    def __init__(self, packed, length):
+        self.packed = packed
+        self.length = int(length)
+        self.shape = (packed.shape[0], self.length)
+    
+    def __len__(self):
+        return self.shape[0]
+    
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return unpackObservations(self.packed[index:index + 1], self.length)[0]
+        return unpackObservations(self.packed[index], self.length)
+    
+    def getStats(self, batchSize = 4096):
+        # np.mean(observations, axis = 0, keepdims = True) and
+        # np.std(observations, ddof = 1) without unpacking all rows at once
+        n = self.shape[0]
+        ones = np.zeros(self.length)
+        for start in range(0, n, batchSize):
+            bits = np.unpackbits(self.packed[start:start + batchSize], axis = 1,
+                                 count = self.length)
+            ones += np.sum(bits, axis = 0)
+        mean = (ones * 255 / n).reshape((1, -1))
+        size = n * self.length
+        p = np.sum(ones) / size
+        std = 255 * (p * (1 - p) * size / (size - 1))**0.5
+        return mean, std
+
+def getObservations(d):
+    # The 'observations' column of a data set, packed or not
+    if OBSERVATIONS_PACKED in d:
+        if OBSERVATIONS_LENGTH not in d:
+            raise Exception("Packed observations without their length", OBSERVATIONS_LENGTH)
+        lengths = np.asarray(d[OBSERVATIONS_LENGTH][:])
+        if len(lengths) == 0:
+            return PackedObservations(d[OBSERVATIONS_PACKED], 0)
+        if np.min(lengths) != np.max(lengths):
+            raise Exception("Packed observations of different lengths",
+                            np.min(lengths), np.max(lengths))
+        return PackedObservations(d[OBSERVATIONS_PACKED], lengths[0])
+    return d['observations']
+
+class ColumnBuffer():
+    # Array that grows along axis 0 by doubling its capacity, so appending a
+    # row costs amortized O(1) instead of copying the whole history as
+    # np.append does. The dtype is promoted the same way np.append would.
+    def __init__(self, array):
+        self.buffer = np.asarray(array)
+        self.length = len(self.buffer)
+    
+    def __len__(self):
+        return self.length
+    
+    def append(self, rows):
+        rows = np.asarray(rows)
+        if self.buffer.ndim == 1:
+            rows = rows.reshape(-1) # np.append without axis flattens
+        dtype = np.result_type(self.buffer.dtype, rows.dtype)
+        length = self.length + len(rows)
+        if length > len(self.buffer) or dtype != self.buffer.dtype:
+            capacity = max(length, 2 * len(self.buffer), 16)
+            buffer = np.empty((capacity,) + self.buffer.shape[1:], dtype = dtype)
+            buffer[0:self.length] = self.buffer[0:self.length]
+            self.buffer = buffer
+        self.buffer[self.length:length] = rows
+        self.length = length
+    
+    def view(self):
+        return self.buffer[0:self.length]
+    
+    def clear(self):
+        # Drop the rows but keep the capacity
+        self.length = 0
+    
+    def __getstate__(self):
+        # The unused capacity is not pickled
+        return {'buffer': self.view(), 'length': self.length}
 
 class Data():
     def __init__(self, robot):
@@ -16,25 +112,51 @@ class Data():
         self.robot = robot
         dynamics = self.robot.scene.dynamics
         pc = self.robot.pointCloud
-        self.d = dict() # Will become None after the scene is saved
-        self.d['epi_starts'] = np.array([], dtype = np.bool)
-        if self.mode < 0:
-            self.d['observations'] = np.zeros((0, pc.hPix * pc.wPix), dtype = np.int8)
+        d = dict()
+        d['epi_starts'] = np.array([], dtype = np.bool)
+        # Binary maps can be stored with one bit per cell, see Scene.packObservations
+        self.packed = (self.robot.scene.packObservations and self.mode < 0 and
+                       self.robot.scene.occupancyMapType == self.robot.scene.OCCUPANCY_MAP_BINARY)
+        if self.packed:
+            d[OBSERVATIONS_PACKED] = np.zeros((0, (pc.hPix * pc.wPix + 7) // 8), dtype = np.uint8)
+            d[OBSERVATIONS_LENGTH] = np.zeros(0, dtype = np.int32)
+        elif self.mode < 0:
+            d['observations'] = np.zeros((0, pc.hPix * pc.wPix * pc.getNumChannels()),
+                                         dtype = np.int8)
         elif self.mode > 0:
-            self.d['observations'] = np.zeros((0, pc.hPix * pc.wPix * 2), dtype = np.int8)
-            self.d['observations2'] = np.zeros((0, 2), dtype = np.float32)
-        self.d['observations1'] = np.zeros((0, pc.lenScanVector), dtype = np.float32)
+            d['observations'] = np.zeros((0, pc.hPix * pc.wPix * pc.getNumChannels() * 2),
+                                         dtype = np.int8)
+            d['observations2'] = np.zeros((0, 2), dtype = np.float32)
+        d['observations1'] = np.zeros((0, pc.lenScanVector), dtype = np.float32)
         if dynamics == 5:
-            self.d['obs2'] = np.zeros((0, 2), dtype = np.float32)
+            d['obs2'] = np.zeros((0, 2), dtype = np.float32)
         elif dynamics == 16:
-            self.d['obs2'] = np.zeros((0, 2), dtype = np.float32)
+            d['obs2'] = np.zeros((0, 2), dtype = np.float32)
         elif dynamics == 17:
-            self.d['obs2'] = np.zeros((0, 8), dtype = np.float32)
+            d['obs2'] = np.zeros((0, 8), dtype = np.float32)
         elif dynamics == 18:
-            self.d['obs2'] = np.zeros((0, 6), dtype = np.float32)
+            d['obs2'] = np.zeros((0, 6), dtype = np.float32)
         else:
             raise Exception("Undefined robot dynamics for data recording", dynamics)
-        self.d['actions'] = np.zeros((0, 2), dtype = np.float32)
+        d['actions'] = np.zeros((0, 2), dtype = np.float32)
+        self.d = d
+    
+    @property
+    def d(self):
+        # Dict of arrays with the recorded rows (views of the column buffers)
+        return {key: column.view() for key, column in self.columns.items()}
+    
+    @d.setter
+    def d(self, d):
+        self.columns = {key: ColumnBuffer(d[key]) for key in d}
+    
+    def __setstate__(self, state):
+        # Scenes pickled before the column buffers have a plain dict d
+        if 'd' in state:
+            d = state.pop('d')
+            state['columns'] = {key: ColumnBuffer(d[key]) for key in d}
+        self.__dict__.update(state)
+    
     def getObservation(self, mode):
         # This function can not run after scene has been saved as a pickle file
         if mode == 0:
@@ -106,17 +228,21 @@ class Data():
         if observation is None:
             return
         
-        if len(self.d['epi_starts']) == 0:
-            self.d['epi_starts'] = np.append(self.d['epi_starts'], True)
+        columns = self.columns
+        if len(columns['epi_starts']) == 0:
+            columns['epi_starts'].append(True)
         else:
-            self.d['epi_starts'] = np.append(self.d['epi_starts'], False)
+            columns['epi_starts'].append(False)
         
-        self.d['observations'] = np.append(self.d['observations'], observation, axis = 0) # option 1
+        if self.packed:
+            columns[OBSERVATIONS_PACKED].append(packObservations(observation))
+            columns[OBSERVATIONS_LENGTH].append(np.array([observation.size], dtype = np.int32))
+        else:
+            columns['observations'].append(observation) # option 1
         if self.mode >= 0:
-            self.d['observations2'] = np.append(self.d['observations2'], observation2, axis = 0)
+            columns['observations2'].append(observation2)
             
-        self.d['observations1'] = np.append(self.d['observations1'], 
-                              self.robot.pointCloud.scanVector, axis = 0) # option 2
+        columns['observations1'].append(self.robot.pointCloud.scanVector) # option 2
         
         if self.robot.scene.dynamics == 5:
             pass
@@ -136,33 +262,38 @@ class Data():
                          peer.xi.x, peer.xi.y, peer.xi.theta] 
                         + dstars] # mode = -12
             #print("Robot", self.robot.index, ", psi: ", psi)
-        self.d['obs2'] = np.append(self.d['obs2'], obs2Data, axis = 0)
-        self.d['actions'] = np.append(self.d['actions'], 
-                  [[self.robot.v1Desired, self.robot.v2Desired]], axis = 0)
+        columns['obs2'].append(obs2Data)
+        columns['actions'].append([[self.robot.v1Desired, self.robot.v2Desired]])
         
     def append(self, data2):
         # Append data collected in a run
-        for key in self.d:
-            self.d[key] =  np.append(self.d[key], data2.d[key], axis = 0)
+        for key in self.columns:
+            self.columns[key].append(data2.columns[key].view())
     
     def store(self):
-        i = self.robot.index
-        directory = 'data'
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-        count = 0
-        for filename in os.listdir(directory):
-            if filename[0:4] != "data" or filename[-4:] != ".npz":
-                continue
-            name, _ = os.path.splitext(filename)
-            n = int(name[4:7])
-            if count < n:
-                count = n
-        count += 1
-        path = os.path.join(directory, 'data' + str(count).zfill(3) + '_' + str(i))
-        np.savez(path, **(self.d))
-        message = "Training data of length {0:d} saved to " + path + ".npz"
-        message = message.format(len(self.d['epi_starts']))
+        path = store(self.d, self.robot.index)
+        message = "Training data of length {0:d} saved to " + path
+        message = message.format(len(self.columns['epi_starts']))
         self.robot.scene.log(message)
         
-        
\ No newline at end of file
+def nextRunNumber(directory = 'data'):
+    # Next XXX for dataXXX_i.npz files and dataXXX_i shard directories
+    return runindex.nextRunNumber(directory, 'data')
+
+def store(d, i):
+    # Save the columns in d as data/dataXXX_i.npz, XXX is the next run number
+    directory = 'data'
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    count = nextRunNumber(directory)
+    path = os.path.join(directory, 'data' + str(count).zfill(3) + '_' + str(i))
+    np.savez(path, **d)
+    return path + ".npz"
+
+def shardDirectory(i):
+    # data/dataXXX_i for a recorder.ShardRecorder, XXX is the next run number
+    directory = 'data'
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    count = nextRunNumber(directory)
+    return os.path.join(directory, 'data' + str(count).zfill(3) + '_' + str(i))
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:31:47 2026
+
+Out-of-core training data for DeepFCL. A Dataset opens the .npy shards of
+a recorder.ShardRecorder directory (fileFormat = FORMAT_NPY) with
+mmap_mode = 'r' and behaves like the dict returned by np.load(...npz):
+dataset['observations'] is a column that is indexed with the minibatch
+indices, and only those rows are read from disk. Together with getStats()
+and normalize() the memory used by training is proportional to the batch
+size instead of the data set size.
+
+convert() turns an existing .npz data set into such a directory, reading it
+a chunk of rows at a time, and merge() concatenates any number of data sets
+with at most one chunk in memory.
+
+@author: cz
+"""
+
+import numpy as np
+import zipfile
+import os
+import recorder
+
+class MmapColumn():
+    # One column over the shards, indexed like an (n, ...) array along axis 0
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.offsets = np.cumsum([0] + [len(a) for a in arrays])
+        self.dtype = np.result_type(*[a.dtype for a in arrays])
+        self.shape = (int(self.offsets[-1]),) + arrays[0].shape[1:]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            shard = np.searchsorted(self.offsets, index, 'right') - 1
+            return self.arrays[shard][index - self.offsets[shard]]
+        if isinstance(index, slice):
+            index = np.arange(*index.indices(len(self)))
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        out = np.empty((len(index),) + self.shape[1:], dtype = self.dtype)
+        shards = np.searchsorted(self.offsets, index, 'right') - 1
+        for shard in np.unique(shards):
+            mask = shards == shard
+            out[mask] = self.arrays[shard][index[mask] - self.offsets[shard]]
+        return out
+
+class Dataset():
+    def __init__(self, directory):
+        manifest = recorder.readManifest(directory)
+        if manifest['format'] != recorder.FORMAT_NPY:
+            raise Exception("Memory-mapped data set needs .npy shards", directory)
+        arrays = dict()
+        for shard in recorder.getShards(directory):
+            d = recorder.loadShard(directory, shard, mmapMode = 'r')
+            for key in d:
+                arrays.setdefault(key, []).append(d[key])
+        self.columns = {key: MmapColumn(arrays[key]) for key in arrays}
+        self.files = list(self.columns.keys())
+
+    def __len__(self):
+        return len(self.columns['epi_starts'])
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+def getStats(observations, batchSize = 4096):
+    # np.mean(observations, axis = 0, keepdims = True) and
+    # np.std(observations, ddof = 1), read batchSize rows at a time
+    if hasattr(observations, 'getStats'): # data.PackedObservations
+        return observations.getStats(batchSize)
+    n = len(observations)
+    total = np.zeros((1,) + observations.shape[1:])
+    for start in range(0, n, batchSize):
+        total += np.sum(observations[start:start + batchSize], axis = 0, dtype = np.float64)
+    mean = total / n
+    size = n * np.prod(observations.shape[1:])
+    meanAll = np.sum(total) / size
+    squares = 0.0
+    for start in range(0, n, batchSize):
+        squares += np.sum((observations[start:start + batchSize] - meanAll)**2)
+    return mean, (squares / (size - 1))**0.5
+
+def normalize(observations, mean, std):
+    # (observations - mean) / std of one minibatch in float32
+    return ((np.asarray(observations, dtype = np.float32) - mean.astype(np.float32))
+            / np.float32(std))
+
+def openNpzMember(zf, name):
+    # Open the .npy member name of an uncompressed .npz and read its header
+    f = zf.open(name)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+    if fortran or dtype.hasobject:
+        raise Exception("Cannot stream array", name)
+    return f, shape, dtype
+
+def readRows(f, shape, dtype, rows):
+    # The next rows rows of an opened member
+    count = rows * int(np.prod(shape[1:]))
+    buffer = f.read(count * dtype.itemsize)
+    return np.frombuffer(buffer, dtype = dtype).reshape((rows,) + shape[1:])
+
+def iterNpzChunks(path, chunkRows = 4096):
+    # Yields dicts with chunkRows rows of every array of an uncompressed .npz
+    # (np.savez) without loading whole arrays
+    with zipfile.ZipFile(path) as zf:
+        files = []
+        for name in zf.namelist():
+            f, shape, dtype = openNpzMember(zf, name)
+            files.append((name[:-4], f, shape, dtype))
+        n = files[0][2][0]
+        for start in range(0, n, chunkRows):
+            rows = min(chunkRows, n - start)
+            d = dict()
+            for key, f, shape, dtype in files:
+                d[key] = readRows(f, shape, dtype, rows)
+            yield d
+        for key, f, shape, dtype in files:
+            f.close()
+
+def iterNpzMember(path, name, chunkRows):
+    with zipfile.ZipFile(path) as zf:
+        f, shape, dtype = openNpzMember(zf, name)
+        with f:
+            for start in range(0, shape[0], chunkRows):
+                yield readRows(f, shape, dtype, min(chunkRows, shape[0] - start))
+
+def iterArray(array, chunkRows):
+    for start in range(0, len(array), chunkRows):
+        yield array[start:start + chunkRows]
+
+def getParts(source):
+    # {key: [(shape, dtype, iterChunks)]} of a .npz file or a recorder
+    # directory, read from the headers only. iterChunks(chunkRows) yields
+    # the rows of one part chunk by chunk.
+    parts = dict()
+    if os.path.isdir(source):
+        for shard in recorder.getShards(source):
+            if shard['file'].endswith('.npz'):
+                shardParts = getParts(os.path.join(source, shard['file']))
+                for key in shardParts:
+                    parts.setdefault(key, []).extend(shardParts[key])
+            else:
+                d = recorder.loadShard(source, shard, mmapMode = 'r')
+                for key in d:
+                    parts.setdefault(key, []).append(
+                            (d[key].shape, d[key].dtype,
+                             lambda chunkRows, array = d[key]: iterArray(array, chunkRows)))
+        return parts
+    with zipfile.ZipFile(source) as zf:
+        for name in zf.namelist():
+            f, shape, dtype = openNpzMember(zf, name)
+            f.close()
+            parts.setdefault(name[:-4], []).append(
+                    (shape, dtype,
+                     lambda chunkRows, name = name: iterNpzMember(source, name, chunkRows)))
+    return parts
+
+def getSchema(sources):
+    # Parts of every source, checked to have the same keys, the same row
+    # shape per key and the same number of rows in every column of a source.
+    # Returns the parts per key, the output dtype (promoted as np.append
+    # would) and shape per key.
+    allParts = [getParts(source) for source in sources]
+    keys = list(allParts[0].keys())
+    parts = {key: [] for key in keys}
+    dtypes = dict()
+    shapes = dict()
+    for source, sourceParts in zip(sources, allParts):
+        if set(sourceParts.keys()) != set(keys):
+            raise Exception("Keys of the data sets differ", source,
+                            sorted(sourceParts.keys()), sorted(keys))
+        rows = None
+        for key in keys:
+            keyRows = 0
+            for shape, dtype, iterChunks in sourceParts[key]:
+                if key not in shapes:
+                    shapes[key] = tuple(shape[1:])
+                    dtypes[key] = dtype
+                elif tuple(shape[1:]) != shapes[key]:
+                    raise Exception("Column shapes of the data sets differ", source,
+                                    key, tuple(shape[1:]), shapes[key])
+                dtypes[key] = np.result_type(dtypes[key], dtype)
+                keyRows += shape[0]
+            if rows is None:
+                rows = keyRows
+            elif keyRows != rows:
+                raise Exception("Columns have different lengths", source, key)
+            parts[key].extend(sourceParts[key])
+    shapes = {key: (sum(part[0][0] for part in parts[key]),) + shapes[key]
+              for key in keys}
+    return parts, dtypes, shapes
+
+def merge(sources, output, chunkRows = 4096):
+    # Concatenate the data sets in sources (.npz files or recorder
+    # directories) key by key into output. The output size is known from the
+    # headers, so every column is copied chunk by chunk into an uncompressed
+    # .npz (output ending with .npz) or into memory-mapped .npy files of a
+    # recorder directory. Returns the number of rows.
+    parts, dtypes, shapes = getSchema(sources)
+    keys = list(parts.keys())
+    if output.endswith('.npz'):
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED, allowZip64 = True) as zf:
+            for key in keys:
+                header = {'descr': np.lib.format.dtype_to_descr(dtypes[key]),
+                          'fortran_order': False, 'shape': shapes[key]}
+                with zf.open(key + '.npy', 'w', force_zip64 = True) as f:
+                    np.lib.format.write_array_header_2_0(f, header)
+                    for shape, dtype, iterChunks in parts[key]:
+                        for chunk in iterChunks(chunkRows):
+                            f.write(np.ascontiguousarray(chunk, dtype = dtypes[key]).tobytes())
+    else:
+        if not os.path.exists(output):
+            os.makedirs(output)
+        name = 'shard00000'
+        for key in keys:
+            out = np.lib.format.open_memmap(os.path.join(output, name + '_' + key + '.npy'),
+                                            mode = 'w+', dtype = dtypes[key],
+                                            shape = shapes[key])
+            start = 0
+            for shape, dtype, iterChunks in parts[key]:
+                for chunk in iterChunks(chunkRows):
+                    out[start:start + len(chunk)] = chunk
+                    start += len(chunk)
+            out.flush()
+            del out
+        rows = shapes[keys[0]][0]
+        recorder.writeManifest(output, [{'file': name, 'stream': 0, 'rows': rows,
+                                         'keys': keys}],
+                               rows, recorder.FORMAT_NPY, True)
+    return shapes[keys[0]][0]
+
+def convert(path, directory, shardSize = 4096):
+    # Write the .npz data set at path as .npy shards to directory
+    rec = recorder.ShardRecorder(directory, shardSize, recorder.FORMAT_NPY)
+    for d in iterNpzChunks(path, shardSize):
+        rec.add(d)
+    rec.close()
+    return rec.rows
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:48:21 2026
+
+Integrators for the differential drive (unicycle) model used by
+State.propagate and SwarmState.propagate. The wheel speeds are held
+constant over a step, so the closed-form arc ("exact") has no integration
+error at all and RK4 is close to it even for steps much larger than
+Scene.dt = 0.01. The functions work on floats and on numpy arrays.
+
+@author: cz
+"""
+
+import numpy as np
+import math
+
+EULER = 'euler'
+EXACT = 'exact'
+RK4 = 'rk4'
+
+def eulerStep(x, y, theta, v, omega, dt):
+    return (x + np.cos(theta) * v * dt,
+            y + np.sin(theta) * v * dt,
+            theta + omega * dt)
+
+def exactStep(x, y, theta, v, omega, dt):
+    # Closed-form arc; straight line where omega is (numerically) zero
+    theta1 = theta + omega * dt
+    straight = np.fabs(omega) < 1e-9
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        r = np.where(straight, 0.0, v / omega)
+        dx = np.where(straight, np.cos(theta) * v * dt,
+                      r * (np.sin(theta1) - np.sin(theta)))
+        dy = np.where(straight, np.sin(theta) * v * dt,
+                      -r * (np.cos(theta1) - np.cos(theta)))
+    return x + dx, y + dy, theta1
+
+def rk4Step(x, y, theta, v, omega, dt):
+    # v and omega are constant over the step, so only theta varies
+    theta2 = theta + omega * dt / 2
+    theta4 = theta + omega * dt
+    cosSum = np.cos(theta) + 4 * np.cos(theta2) + np.cos(theta4)
+    sinSum = np.sin(theta) + 4 * np.sin(theta2) + np.sin(theta4)
+    return (x + v * dt / 6 * cosSum,
+            y + v * dt / 6 * sinSum,
+            theta4)
+
+steps = {EULER: eulerStep, EXACT: exactStep, RK4: rk4Step}
+
+def propagate(x, y, theta, v1, v2, l, dt, method = EULER, subDt = None):
+    # Advance the unicycle by dt with wheel speeds v1 (left) and v2 (right).
+    # With subDt the step is split into ceil(dt / subDt) equal sub-steps.
+    if method not in steps:
+        raise Exception("Undefined integrator", method)
+    step = steps[method]
+    n = 1
+    if subDt is not None and subDt < dt:
+        n = int(math.ceil(dt / subDt - 1e-9))
+    h = dt / n
+    v = (v1 + v2) / 2
+    omega = (v2 - v1) / l
+    for k in range(n):
+        x, y, theta = step(x, y, theta, v, omega, h)
+    return x, y, theta
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:42:05 2026
+
+Buffered log backend for Scene.log. Records are kept in memory and written
+by a background thread in batches, once maxRecords are pending or every
+flushInterval seconds, instead of opening and closing the log file for
+every line. close() (called by Scene.deallocate) writes whatever is left;
+loggers still open at interpreter exit are closed then as well.
+
+In text mode the lines are the same as before. In binary mode every record
+is a fixed header (wall clock time, run number, sim time, message length)
+followed by the UTF-8 message, see readBinaryLog().
+
+@author: cz
+"""
+
+import threading
+import datetime
+import struct
+import time
+import atexit
+import weakref
+
+# wall clock time (s since epoch), run number, sim time (s), message bytes
+RECORD_HEADER = struct.Struct('<dIdI')
+
+openLoggers = weakref.WeakSet()
+
+def closeAll():
+    for logger in list(openLoggers):
+        logger.close()
+
+atexit.register(closeAll)
+
+def formatRecord(wallTime, runNum, t, message):
+    prefix = ("[" + str(datetime.datetime.fromtimestamp(wallTime)) + "]"
+                + " [run #{0:03d}]"
+                + " [sim time: {1:.3f} s] ")
+    return prefix.format(runNum, t) + message + '\n'
+
+def readBinaryLog(fileName):
+    # Returns the records of a binary log as (wallTime, runNum, t, message)
+    records = []
+    with open(fileName, 'rb') as f:
+        buffer = f.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(buffer):
+        wallTime, runNum, t, length = RECORD_HEADER.unpack_from(buffer, offset)
+        offset += RECORD_HEADER.size
+        message = buffer[offset:offset + length].decode('utf-8')
+        offset += length
+        records.append((wallTime, runNum, t, message))
+    return records
+
+class BufferedLogger():
+    def __init__(self, fileName, binary = False, maxRecords = 256,
+                 flushInterval = 1.0):
+        self.fileName = fileName
+        self.binary = binary
+        self.maxRecords = maxRecords
+        self.flushInterval = flushInterval # s
+        self.init()
+
+    def init(self):
+        self.records = []
+        self.condition = threading.Condition()
+        self.fileLock = threading.Lock() # keeps the batches in order
+        self.thread = None
+        self.closing = False
+
+    def write(self, runNum, t, message):
+        # Only the raw values are stored here, the formatting is done when
+        # the batch is written
+        with self.condition:
+            self.records.append((time.time(), runNum, t, message))
+            if self.thread is None:
+                self.start()
+            elif len(self.records) >= self.maxRecords:
+                self.condition.notify()
+
+    def start(self):
+        self.closing = False
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        openLoggers.add(self)
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.closing and len(self.records) < self.maxRecords:
+                    self.condition.wait(self.flushInterval)
+                closing = self.closing
+            self.flush()
+            if closing:
+                return
+
+    def flush(self):
+        with self.fileLock:
+            with self.condition:
+                records = self.records
+                self.records = []
+            if not records:
+                return
+            if self.binary:
+                chunks = []
+                for wallTime, runNum, t, message in records:
+                    message = message.encode('utf-8')
+                    chunks.append(RECORD_HEADER.pack(wallTime, runNum, t,
+                                                     len(message)))
+                    chunks.append(message)
+                with open(self.fileName, "ab") as f:
+                    f.write(b''.join(chunks))
+            else:
+                lines = [formatRecord(*record) for record in records]
+                with open(self.fileName, "a+") as f:
+                    f.write(''.join(lines))
+
+    def close(self):
+        # Stops the thread and writes all pending records. The logger can
+        # still be written to afterwards, which starts a new thread.
+        with self.condition:
+            thread = self.thread
+            self.thread = None
+            self.closing = True
+            self.condition.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+        openLoggers.discard(self)
+
+    def __getstate__(self):
+        # Scenes are pickled by saver.save(); the thread and the locks are
+        # not, so the pending records are written first
+        self.flush()
+        state = self.__dict__.copy()
+        for key in ('records', 'condition', 'fileLock', 'thread', 'closing'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.init()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:40:52 2026
+
+Time series of the plotted metrics (Scene.ts, Scene.ydict, ...). A
+MetricSeries keeps its samples in a preallocated NumPy array that doubles
+when full, instead of a list of Python floats, and reads like an array:
+len(), indexing and np.asarray() give the recorded samples.
+
+@author: cz
+"""
+
+import numpy as np
+
+class MetricSeries():
+    def __init__(self, width = None, dtype = np.float64, capacity = 256):
+        # width None: one scalar per sample, otherwise rows of width values
+        shape = (capacity,) if width is None else (capacity, width)
+        self.buffer = np.empty(shape, dtype = dtype)
+        self.length = 0
+
+    def append(self, value):
+        if self.length == len(self.buffer):
+            buffer = np.empty((2 * len(self.buffer),) + self.buffer.shape[1:],
+                              dtype = self.buffer.dtype)
+            buffer[0:self.length] = self.buffer
+            self.buffer = buffer
+        self.buffer[self.length] = value
+        self.length += 1
+
+    def view(self):
+        return self.buffer[0:self.length]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def __setitem__(self, index, value):
+        self.view()[index] = value
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __array__(self, dtype = None, copy = None):
+        if dtype is None:
+            return self.view()
+        return self.view().astype(dtype)
+
+    def getMemoryUsage(self):
+        # (bytes in use, bytes allocated)
+        return self.view().nbytes, self.buffer.nbytes
+
+    def __getstate__(self):
+        # The unused capacity is not pickled
+        return {'buffer': self.view().copy(), 'length': self.length}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if len(self.buffer) == 0:
+            self.buffer = np.empty((1,) + self.buffer.shape[1:], dtype = self.buffer.dtype)
+
+def toMetricSeries(values):
+    # MetricSeries holding a list or array of samples, as stored in the
+    # plots of scenes pickled before MetricSeries; other values are kept
+    if not isinstance(values, (list, np.ndarray)):
+        return values
+    values = np.asarray(values, dtype = np.float64)
+    series = MetricSeries(None if values.ndim < 2 else values.shape[1],
+                          capacity = max(len(values), 1))
+    series.buffer[0:len(values)] = values
+    series.length = len(values)
+    return series
+
+def toMetricSeriesDict(series):
+    # toMetricSeries() over a (nested) dict such as Scene.ydict, in place
+    for key, value in series.items():
+        if isinstance(value, dict):
+            toMetricSeriesDict(value)
+        else:
+            series[key] = toMetricSeries(value)
+    return series
+
+def getMemoryUsage(series):
+    # {name: (bytes in use, bytes allocated)} of the MetricSeries in a
+    # (nested) dict such as Scene.ydict; names are tuples of the keys
+    usage = dict()
+    for key, value in series.items():
+        if isinstance(value, MetricSeries):
+            usage[(key,)] = value.getMemoryUsage()
+        elif isinstance(value, dict):
+            for name, bytes in getMemoryUsage(value).items():
+                usage[(key,) + name] = bytes
+    return usage
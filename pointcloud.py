@@ -6,19 +6,21 @@ Created on Tue Feb  6 09:08:39 2018
 """
 import numpy as np
 import math
+from data import ColumnBuffer
 
 class PointCloud():
     def __init__(self, robot):
         self.robot = robot
-        self.data = []
-        self.dataCropped = []
+        # Points of the current sweep, (N, 3) float32 [x, y, z]. The quarter
+        # scans of VPL16 are accumulated in a buffer that keeps its capacity
+        # from sweep to sweep; self.data is a view of the filled part.
+        self.points = ColumnBuffer(np.zeros((0, 3), np.float32))
+        self.data = self.points.view()
+        self.dataCropped = np.zeros((0, 2), np.float32)
+        self.zCropped = np.zeros(0, np.float32) # heights of dataCropped
         
         # For visualization of laser scan vector (option 2)
-        self.lenScanVector = 50
-        self.maxRange = 5
-        self.scanVector = np.ones((1, self.lenScanVector), np.float32) * self.maxRange
-        self.scanAngle = ((np.asarray(range(self.lenScanVector)) + 0.5)  * 
-                          (2 * math.pi / self.lenScanVector))
+        self.setScanVector(50, 5)
         
         # For visualization of occupancy map (option 1)
         self.wPix = 50
@@ -27,49 +29,214 @@ class PointCloud():
         self.yMax = 5
         self.clearOccupancyMap()
         
+        # Crop limits besides xMax, yMax
+        self.zMin = -0.3 # height floor
+        self.footprint = 0.20 # half width of the square around the robot
+        
+        # Three-channel map: heights zMin...zMax are scaled to 0...255 and
+        # visibility is traced along lenVisibility directions
+        self.zMax = 1.0
+        self.lenVisibility = 360
+        self.cellGeometryKey = None
+        self.getCellGeometry()
+        self.statsIndex = np.zeros(0, np.intp)
+        self.statsWeights = np.zeros(0)
+        
+    def setScanVector(self, lenScanVector, maxRange):
+        # Number of direction bins and range of the scan vector. The width of
+        # Data's 'observations1' is taken from lenScanVector when the robot
+        # is created.
+        self.lenScanVector = lenScanVector
+        self.maxRange = maxRange
+        self.scanVector = np.ones((1, self.lenScanVector), np.float32) * self.maxRange
+        self.scanAngle = ((np.asarray(range(self.lenScanVector)) + 0.5)  * 
+                          (2 * math.pi / self.lenScanVector))
+        
     def clearOccupancyMap(self):
         if self.robot.scene.occupancyMapType == self.robot.scene.OCCUPANCY_MAP_BINARY:
             self.occupancyMap = np.ones((self.hPix, self.wPix), np.uint8) * 255
         elif self.robot.scene.occupancyMapType == self.robot.scene.OCCUPANCY_MAP_THREE_CHANNEL:
             self.occupancyMap = np.zeros((self.hPix, self.wPix, 3), np.uint8)
+        self.hitCounts = np.zeros((self.hPix, self.wPix), np.intp) # points per cell
             
     def clearData(self):
-        self.data = []
-        self.dataCropped = []
+        self.points.clear()
+        self.data = self.points.view()
+        self.dataCropped = np.zeros((0, 2), np.float32)
+        self.zCropped = np.zeros(0, np.float32)
         
     def addRawData(self, rawData):
-        newData = []
-        for i in range(0, len(rawData), 3):
-            x = rawData[i]
-            z = rawData[i + 1]
-            y = rawData[i + 2]
-            newData.append(np.float32([x, y, z]))
+        # rawData: flat [x, z, y, x, z, y, ...] from vrep, a list or any
+        # float32 buffer (read without copying)
+        try:
+            isFloat32 = memoryview(rawData).format == 'f'
+        except TypeError: # list
+            isFloat32 = False
+        if isFloat32:
+            raw = np.frombuffer(rawData, dtype = np.float32)
+        else:
+            raw = np.asarray(rawData, dtype = np.float32).reshape(-1)
+        n = len(raw) // 3
+        newData = raw[0:3 * n].reshape((n, 3))[:, (0, 2, 1)] # x, z, y -> x, y, z
         #newData = self.rotate(newData)
-        self.data = self.data + newData
+        self.points.append(newData)
+        self.data = self.points.view()
     
     def updateOccupancyMap(self):
         self.clearOccupancyMap()
+        pixels = self.rasterize(self.dataCropped) # option 1
         if self.robot.scene.occupancyMapType == self.robot.scene.OCCUPANCY_MAP_BINARY:
              #r = int(self.l/2*self.m2pix()) # radius, option 1
-             pointCloudPix = self.m2pix(self.dataCropped) # option 1
-             for i in range(len(pointCloudPix)):
-                 self.occupancyMap[(pointCloudPix[i][0], pointCloudPix[i][1])] = 0 # option 1
+             self.occupancyMap.reshape(-1)[pixels] = 0 # option 1
         elif self.robot.scene.occupancyMapType == self.robot.scene.OCCUPANCY_MAP_THREE_CHANNEL:
-            self.occupancyMap = np.zeros((self.hPix, self.wPix, 3), np.uint8)
+            self.updateThreeChannelMap(pixels)
             
+    def updateThreeChannelMap(self, pixels):
+        # Channels: mean height, height variance, visibility. The height
+        # statistics come from the count and the sums of z and z^2 per cell,
+        # both sums accumulated with one np.bincount over the cropped points
+        # (indices pixels and pixels + size).
+        size = self.hPix * self.wPix
+        n = len(pixels)
+        index, weights = self.getStatsBuffers(n)
+        index[0:n] = pixels
+        np.add(pixels, size, out = index[n:])
+        weights[0:n] = self.zCropped
+        np.multiply(weights[0:n], weights[0:n], out = weights[n:])
+        sums = np.bincount(index, weights = weights, minlength = 2 * size)
+        count = self.hitCounts.reshape(-1)
+        hit = count > 0
+        mean = np.divide(sums[0:size], count, out = np.zeros(size), where = hit)
+        variance = np.divide(sums[size:], count, out = np.zeros(size), where = hit) - mean**2
+        heightRange = self.zMax - self.zMin
+        self.occupancyMap = np.zeros((self.hPix, self.wPix, 3), np.uint8)
+        channels = self.occupancyMap.reshape((size, 3))
+        channels[:, 0] = np.where(hit, np.clip((mean - self.zMin) / heightRange * 255, 0, 255), 0)
+        # The variance of heights in zMin...zMax is at most (heightRange / 2)^2
+        channels[:, 1] = np.clip(variance / (heightRange / 2)**2 * 255, 0, 255)
+        # A cell is visible if it is not farther from the sensor than the
+        # nearest hit cell in its direction. Hit cells occlude all the bins
+        # they span, so this is a pass over the cells, not the points.
+        cellRange, cellBin = self.getCellGeometry()
+        occluded = np.where(hit[self.occluderCell], self.occluderRange, np.inf)
+        nearest = np.minimum.reduceat(occluded, self.binStarts)
+        channels[:, 2] = (hit | (cellRange <= nearest[cellBin])) * np.uint8(255)
         
-    def updateScanVector(self):
-        self.scanVector = np.ones((1, self.lenScanVector), np.float32) * self.maxRange
-        for i in range(len(self.data)):
-            x = self.data[i][0]
-            y = self.data[i][1]
-            dist = (x ** 2 + y ** 2 ) ** 0.5
-            k = math.ceil((math.atan2(y, x) + math.pi) 
-                            / 2 / math.pi * self.lenScanVector) - 1 # bin index
-            if self.scanVector[0, k] > dist:
-                self.scanVector[0, k] = dist
-            #print('dist: ', dist)
+    def getStatsBuffers(self, n):
+        # Index and weight arrays of 2 * n entries for updateThreeChannelMap,
+        # kept from sweep to sweep: allocating arrays of this size on every
+        # update costs more than the bincount itself
+        if len(self.statsWeights) < 2 * n:
+            capacity = max(2 * n, 2 * len(self.statsWeights))
+            self.statsIndex = np.empty(capacity, np.intp)
+            self.statsWeights = np.empty(capacity)
+        return self.statsIndex[0:2 * n], self.statsWeights[0:2 * n]
+    
+    def getCellGeometry(self):
+        # Distance and visibility bin of every cell center and the occluder
+        # table of the visibility channel, computed again only when the map
+        # size, extent or lenVisibility change. The table has one entry per
+        # cell and bin that the cell spans, sorted by bin and distance, and
+        # where each bin starts in it (no bin is empty, the cells at the
+        # sensor span all of them).
+        key = (self.hPix, self.wPix, self.xMax, self.yMax, self.lenVisibility)
+        if self.cellGeometryKey != key:
+            cellAngle, self.cellRange = self.getCellPolar()
+            self.cellBin = self.getDirectionBins(cellAngle, self.lenVisibility)
+            first, last = self.getCellBinSpan(cellAngle)
+            numBins = last - first + 1
+            cell = np.repeat(np.arange(len(cellAngle)), numBins)
+            offset = np.cumsum(numBins) - numBins
+            occluderBin = (np.repeat(first - offset, numBins) +
+                           np.arange(numBins.sum())) % self.lenVisibility
+            order = np.lexsort((self.cellRange[cell], occluderBin))
+            self.occluderCell = cell[order]
+            self.occluderRange = self.cellRange[self.occluderCell]
+            self.binStarts = np.searchsorted(occluderBin[order], np.arange(self.lenVisibility))
+            self.cellGeometryKey = key
+        return self.cellRange, self.cellBin
+    
+    def getCellBinSpan(self, cellAngle):
+        # First and last visibility bin (the last may be lenVisibility or
+        # more for cells across the angle -pi) that the corners of each cell
+        # span, all bins for the cells at the sensor
+        halfW = self.xMax / self.wPix
+        halfH = self.yMax / self.hPix
+        x, y = self.getCellCenters()
+        corners = [np.arctan2(y + dy, x + dx) for dx in (-halfW, halfW) for dy in (-halfH, halfH)]
+        # corner angles relative to the center, within -pi...pi
+        relative = [(angle - cellAngle + math.pi) % (2 * math.pi) - math.pi for angle in corners]
+        low = cellAngle + np.min(relative, axis = 0)
+        high = cellAngle + np.max(relative, axis = 0)
+        scale = self.lenVisibility / 2 / math.pi
+        first = np.ceil((low + math.pi) * scale).astype(np.intp) - 1
+        last = np.ceil((high + math.pi) * scale).astype(np.intp) - 1
+        atSensor = (np.fabs(x) <= halfW) & (np.fabs(y) <= halfH)
+        first[atSensor] = 0
+        last[atSensor] = self.lenVisibility - 1
+        return first, last
+    
+    def getCellCenters(self):
+        # x and y of every cell center (flat, in the order of the map)
+        row, column = np.indices((self.hPix, self.wPix))
+        x = self.xMax - (row.reshape(-1) + 0.5) / (self.wPix / self.xMax / 2)
+        y = self.yMax - (column.reshape(-1) + 0.5) / (self.hPix / self.yMax / 2)
+        return x, y
+    
+    def getCellPolar(self):
+        # Angle and distance from the sensor of every cell center
+        x, y = self.getCellCenters()
+        return np.arctan2(y, x), (x**2 + y**2)**0.5
+    
+    def getPolar(self, p):
+        # Angle atan2(y, x) (float64) and distance (float32) of every point.
+        # The old loop squared with the powf of the C library, which is not
+        # always correctly rounded, so distances can differ from it by one
+        # float32 ulp (< 5e-7 m).
+        x = np.ascontiguousarray(p[:, 0], dtype = np.float32)
+        y = np.ascontiguousarray(p[:, 1], dtype = np.float32)
+        return (np.arctan2(y.astype(np.float64), x.astype(np.float64)),
+                np.sqrt(x * x + y * y))
+    
+    def getDirectionBins(self, angle, numBins):
+        # Bin of angle in numBins equal bins over -pi...pi
+        k = np.ceil((angle + math.pi) / 2 / math.pi * numBins).astype(np.intp) - 1
+        k[k < 0] = numBins - 1 # angle = -pi
+        return k
+    
+    def getNearestRange(self, angle, distance, numBins, maxRange):
+        # Smallest distance in each of numBins directions, maxRange where
+        # there is no point (float32 like the points)
+        nearest = np.full(numBins, maxRange, np.float32)
+        np.minimum.at(nearest, self.getDirectionBins(angle, numBins), distance)
+        return nearest
             
+    def rasterize(self, p):
+        # Flat index into the (hPix, wPix) map of every point of p and the
+        # number of points per cell in self.hitCounts, both in one pass
+        xyPix = self.m2pix(p)
+        pixels = xyPix[:, 0] * self.wPix + xyPix[:, 1]
+        self.hitCounts = np.bincount(pixels, minlength = self.hPix * self.wPix).reshape(
+                (self.hPix, self.wPix))
+        return pixels
+        
+    def updateScanVector(self, occupancyMap = False):
+        # Distance of the nearest point of the whole cloud in each of
+        # lenScanVector directions, at most maxRange. With occupancyMap the
+        # cloud is also cropped and the occupancy map updated (options 1 and
+        # 2 together).
+        angle, distance = self.getPolar(self.data)
+        self.scanVector = self.getNearestRange(angle, distance, self.lenScanVector,
+                                               self.maxRange).reshape((1, self.lenScanVector))
+        if occupancyMap:
+            self.crop()
+            self.updateOccupancyMap()
+            
+    def getNumChannels(self):
+        if self.robot.scene.occupancyMapType == self.robot.scene.OCCUPANCY_MAP_THREE_CHANNEL:
+            return 3
+        return 1
+    
     def getObservation(self):
         if self.robot.scene.occupancyMapType == self.robot.scene.OCCUPANCY_MAP_BINARY:
             osbervation = self.occupancyMap.reshape((1, self.wPix * self.wPix))
@@ -95,18 +262,23 @@ class PointCloud():
         return data
         #self.show()
     
-    def crop(self):
-        self.dataCropped = []
-        for i in range(len(self.data)):
-            x = float(self.data[i][0])
-            y = float(self.data[i][1])
-            z = float(self.data[i][2])
-            MIN = 0.20
-            if any([x > self.xMax, x < -self.xMax, y > self.yMax, y < -self.yMax, z < -0.3]): #
-                continue
-            elif (x < MIN and y < MIN and x > -MIN and y > -MIN):
-                continue
-            self.dataCropped.append(np.float32([x, y]))
+    def crop(self, xMax = None, yMax = None, zMin = None, footprint = None):
+        # Keep the points inside the box |x| <= xMax, |y| <= yMax above the
+        # height floor zMin and outside the square |x|, |y| < footprint of
+        # the robot itself. dataCropped is a contiguous (M, 2) float32 array
+        # of their [x, y]. The limits default to the attributes set in
+        # __init__; the comparisons are made in float64 as before.
+        xMax = np.float64(self.xMax if xMax is None else xMax)
+        yMax = np.float64(self.yMax if yMax is None else yMax)
+        zMin = np.float64(self.zMin if zMin is None else zMin)
+        footprint = np.float64(self.footprint if footprint is None else footprint)
+        x = self.data[:, 0]
+        y = self.data[:, 1]
+        outside = (x > xMax) | (x < -xMax) | (y > yMax) | (y < -yMax) | (self.data[:, 2] < zMin)
+        outside |= (x < footprint) & (x > -footprint) & (y < footprint) & (y > -footprint)
+        mask = ~outside
+        self.dataCropped = np.ascontiguousarray(self.data[mask, 0:2])
+        self.zCropped = self.data[mask, 2]
         #print('dataCropped length:', len(self.dataCropped))
     def getRotationMatrix(self, axis, theta):
         """
@@ -126,12 +298,17 @@ class PointCloud():
     def m2pix(self, p = None):
         if p is None: # if p is None
             return (self.wPix / self.xMax / 2)
-        xyPix = []
-        for i in range(len(p)):
-            xPix = ((self.xMax - p[i][0]) * (self.wPix / self.xMax / 2))
-            yPix = ((self.yMax - p[i][1]) * (self.hPix / self.yMax / 2))
-            xyPix.append(np.uint16([xPix, yPix]))
-        return xyPix
+        # (M, 2) [row, column] of the points of p, clipped to the map (x = -xMax
+        # would be row hPix)
+        xyPix = np.empty((2, len(p)), np.intp) # rows and columns contiguous
+        if len(p) == 0:
+            return xyPix.T
+        p = np.asarray(p)
+        xyPix[0] = (self.xMax - p[:, 0]) * (self.wPix / self.xMax / 2)
+        xyPix[1] = (self.yMax - p[:, 1]) * (self.hPix / self.yMax / 2)
+        np.clip(xyPix[0], 0, self.hPix - 1, out = xyPix[0])
+        np.clip(xyPix[1], 0, self.wPix - 1, out = xyPix[1])
+        return xyPix.T
     
     def show(self):
         pass
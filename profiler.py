@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:10:44 2026
+
+Per-phase timing of Scene.simulate. Set Scene.profiler = StepProfiler() and
+every phase of a step (propagateXid, precompute, readSensorData,
+propagateDesired, propagate/control, calcCOG, simxSynchronousTrigger) is
+timed per robot and per step.
+
+The times are added to preallocated per-step slots indexed by phase and
+robot (Python lists, which are cheaper to update than NumPy elements), so
+a phase costs one perf_counter() call and one addition and the memory does
+not grow with the number of steps. The totals are exact; the per-step
+times behind p50 and p99 are kept for a bounded reservoir sample of the
+steps. Every sample is only stored with trace = True, which
+writeChromeTrace() needs.
+
+@author: cz
+"""
+
+import time
+import json
+import random
+import numpy as np
+
+class StepProfiler():
+    def __init__(self, trace = False, reservoirSize = 4096):
+        self.trace = trace
+        self.phases = []
+        self.phaseIndex = dict() # phase -> row
+        # Time of the current step and of all steps so far per phase (row)
+        # and robot index + 1 (column, 0 for the scene-wide phases)
+        self.current = [[0.0] * 8 for k in range(8)]
+        self.zeros = [0.0] * 8 # a row of current when reset
+        self.totals = np.zeros((8, 8))
+        # Per-step time of every phase (summed over robots) of a uniform
+        # sample of at most reservoirSize steps
+        self.reservoir = np.zeros((reservoirSize, 8))
+        self.random = random.Random(0) # not the stream of the simulation
+        self.step = -1
+        self.stepStart = None
+        self.stepTotal = 0.0 # time of all steps
+        self.samples = [] # with trace: (step, phase, robot or -1, start, duration)
+        self.steps = [] # with trace: (start, duration) of every step
+
+    def beginStep(self):
+        self.step += 1
+        self.stepStart = time.perf_counter()
+        return self.stepStart
+
+    def endStep(self):
+        now = time.perf_counter()
+        self.stepTotal += now - self.stepStart
+        if self.trace:
+            self.steps.append((self.stepStart, now - self.stepStart))
+        current = np.array(self.current)
+        self.totals += current
+        # Reservoir sampling: step s replaces a random row with probability
+        # reservoirSize / (s + 1)
+        size = len(self.reservoir)
+        row = self.step if self.step < size else self.random.randint(0, self.step)
+        if row < size:
+            np.sum(current, axis = 1, out = self.reservoir[row])
+        for times in self.current:
+            times[:] = self.zeros
+
+    def toc(self, phase, t0, robot = -1):
+        # Record the time since t0 under phase and return the current time,
+        # which is the start of the next phase
+        now = time.perf_counter()
+        k = self.phaseIndex.get(phase)
+        if k is None:
+            k = self.addPhase(phase)
+        times = self.current[k]
+        if robot + 1 >= len(times):
+            self.grow(len(self.current), 2 * (robot + 1))
+            times = self.current[k]
+        times[robot + 1] += now - t0
+        if self.trace:
+            self.samples.append((self.step, phase, robot, t0, now - t0))
+        return now
+
+    def addPhase(self, phase):
+        k = len(self.phases)
+        if k == len(self.current):
+            self.grow(2 * k, len(self.zeros))
+        self.phases.append(phase)
+        self.phaseIndex[phase] = k
+        return k
+
+    def grow(self, rows, columns):
+        # Double the arrays so that they have at least rows phases and
+        # columns - 1 robots
+        def resize(array, shape):
+            out = np.zeros(shape)
+            out[0:array.shape[0], 0:array.shape[1]] = array
+            return out
+        self.current = resize(np.array(self.current), (rows, columns)).tolist()
+        self.zeros = [0.0] * columns
+        self.totals = resize(self.totals, (rows, columns))
+        self.reservoir = resize(self.reservoir, (len(self.reservoir), rows))
+
+    def getPhases(self):
+        return list(self.phases)
+
+    def getNumSampledSteps(self):
+        return min(self.step + 1, len(self.reservoir))
+
+    def getTimes(self, phase):
+        # Time spent in phase (summed over robots) on the sampled steps, in
+        # seconds; all steps as long as there are at most reservoirSize
+        return self.reservoir[0:self.getNumSampledSteps(), self.phaseIndex[phase]].copy()
+
+    def getTotal(self, phase, robot = None):
+        # Time spent in phase over all steps, by all robots unless a robot
+        # index is given (-1 for the scene-wide phases), in seconds
+        k = self.phaseIndex[phase]
+        if robot is None:
+            return float(np.sum(self.totals[k]))
+        if robot + 1 >= self.totals.shape[1]:
+            return 0.0
+        return float(self.totals[k, robot + 1])
+
+    def summary(self):
+        # Per phase: mean, p50 and p99 of the time per step and the share
+        # of the total step time
+        result = dict()
+        numSteps = self.step + 1
+        for phase in self.phases:
+            total = self.getTotal(phase)
+            times = self.getTimes(phase)
+            result[phase] = {'mean': total / numSteps if numSteps > 0 else 0.0,
+                             'p50': float(np.percentile(times, 50)) if len(times) > 0 else 0.0,
+                             'p99': float(np.percentile(times, 99)) if len(times) > 0 else 0.0,
+                             'share': total / self.stepTotal if self.stepTotal > 0 else 0.0}
+        return result
+
+    def printSummary(self):
+        print('{0:<24s}{1:>12s}{2:>12s}{3:>12s}{4:>8s}'.format(
+                'phase', 'mean (ms)', 'p50 (ms)', 'p99 (ms)', 'share'))
+        for phase, stats in self.summary().items():
+            print('{0:<24s}{1:>12.4f}{2:>12.4f}{3:>12.4f}{4:>7.1f}%'.format(
+                    phase, stats['mean'] * 1e3, stats['p50'] * 1e3,
+                    stats['p99'] * 1e3, stats['share'] * 100))
+
+    def writeChromeTrace(self, path):
+        # Trace in the Chrome trace event format (chrome://tracing, Perfetto).
+        # Thread 0 holds the scene-wide phases, thread i+1 those of robot i.
+        if not self.trace:
+            raise Exception("Chrome trace needs StepProfiler(trace = True)")
+        events = []
+        for start, duration in self.steps:
+            events.append({'name': 'step', 'ph': 'X', 'pid': 0, 'tid': 0,
+                           'ts': start * 1e6, 'dur': duration * 1e6})
+        for step, phase, robot, start, duration in self.samples:
+            events.append({'name': phase, 'ph': 'X', 'pid': 0, 'tid': robot + 1,
+                           'ts': start * 1e6, 'dur': duration * 1e6,
+                           'args': {'step': step}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:20:31 2026
+
+Streaming recorder for training data. Rows are collected per stream (e.g.
+one stream per robot index). As soon as shardSize rows are pending over all
+streams, the rows of every stream are written to their own shardXXXXX.npz
+(so a shard has at most shardSize rows), followed by manifest.json listing
+the shards written so far. The recorder therefore holds less than one shard
+however long the recording is. Shards and the manifest are written to a
+temporary file first and renamed, so a half written file is never listed.
+
+Rows only reach the recorder per finished episode (runner.streamEpisodes),
+so a crash loses the rows still pending here (less than one shard) and
+also every episode in flight: the running one with numWorkers = 1, else up
+to 2 * numWorkers episodes submitted by runner.iterEpisodes, including
+finished ones not yet handed over.
+
+load() reads the shards back in stream order, i.e. with all rows of stream
+0 first, which is the layout runner.mergeData() gives. With
+fileFormat = FORMAT_NPY every column of a shard is its own uncompressed
+shardXXXXX_key.npy, which dataset.Dataset opens memory-mapped.
+
+@author: cz
+"""
+
+import numpy as np
+import os
+import json
+from data import ColumnBuffer
+
+MANIFEST = 'manifest.json'
+FORMAT_NPZ = 'npz'
+FORMAT_NPY = 'npy'
+
+class ShardRecorder():
+    def __init__(self, directory, shardSize = 4096, fileFormat = FORMAT_NPZ):
+        self.directory = directory
+        self.shardSize = shardSize
+        if fileFormat != FORMAT_NPZ and fileFormat != FORMAT_NPY:
+            raise Exception("Undefined shard format", fileFormat)
+        self.fileFormat = fileFormat
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.buffers = dict() # stream -> {key: ColumnBuffer}
+        self.shards = [] # manifest entries of the shards written
+        self.rows = 0 # rows added, written or not
+        self.pendingRows = 0 # rows added but not written, over all streams
+        self.complete = False
+        self.writeManifest()
+
+    def add(self, d, stream = 0):
+        # d: dict of arrays with the same number of rows, e.g. Data.d
+        if stream not in self.buffers:
+            self.buffers[stream] = {key: ColumnBuffer(np.asarray(d[key])) for key in d}
+        else:
+            columns = self.buffers[stream]
+            for key in d:
+                columns[key].append(d[key])
+        self.rows += len(d['epi_starts'])
+        self.pendingRows += len(d['epi_starts'])
+        if self.pendingRows >= self.shardSize:
+            self.flush()
+
+    def flush(self):
+        # Write the pending rows of every stream in shards of at most
+        # shardSize rows, including partial shards
+        for stream in sorted(self.buffers):
+            while len(self.buffers[stream]['epi_starts']) > 0:
+                self.writeShard(stream, min(len(self.buffers[stream]['epi_starts']),
+                                            self.shardSize))
+        self.pendingRows = 0
+
+    def close(self):
+        self.flush()
+        self.complete = True
+        self.writeManifest()
+
+    def writeShard(self, stream, rows):
+        columns = self.buffers[stream]
+        name = 'shard' + str(len(self.shards)).zfill(5)
+        d = {key: column.view()[0:rows] for key, column in columns.items()}
+        if self.fileFormat == FORMAT_NPZ:
+            name += '.npz'
+            writeAtomic(os.path.join(self.directory, name),
+                        lambda f: np.savez(f, **d))
+        else:
+            for key in d:
+                writeAtomic(os.path.join(self.directory, name + '_' + key + '.npy'),
+                            lambda f: np.save(f, d[key]))
+        # The rest starts the next shard of this stream
+        self.buffers[stream] = {key: ColumnBuffer(column.view()[rows:].copy())
+                                for key, column in columns.items()}
+        self.shards.append({'file': name, 'stream': stream, 'rows': rows,
+                            'keys': list(d.keys())})
+        self.writeManifest()
+
+    def writeManifest(self):
+        writeManifest(self.directory, self.shards, self.shardSize,
+                      self.fileFormat, self.complete)
+
+def writeManifest(directory, shards, shardSize, fileFormat, complete):
+    manifest = {'shardSize': shardSize,
+                'format': fileFormat,
+                'rows': sum(shard['rows'] for shard in shards),
+                'complete': complete,
+                'shards': shards}
+    writeAtomic(os.path.join(directory, MANIFEST),
+                lambda f: f.write(json.dumps(manifest, indent = 1).encode('utf-8')))
+
+def writeAtomic(path, write):
+    # write(f) to a temporary file that is then renamed to path
+    with open(path + '.tmp', 'wb') as f:
+        write(f)
+    os.replace(path + '.tmp', path)
+
+def readManifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)
+
+def getShards(directory):
+    # Manifest entries of the shards in stream order
+    manifest = readManifest(directory)
+    return sorted(manifest['shards'], key = lambda shard: shard['stream']) # stable
+
+def loadShard(directory, shard, mmapMode = None):
+    # Dict of arrays of one shard; mmapMode only applies to .npy shards
+    if shard['file'].endswith('.npz'):
+        with np.load(os.path.join(directory, shard['file'])) as f:
+            return {key: f[key] for key in f.files}
+    return {key: np.load(os.path.join(directory, shard['file'] + '_' + key + '.npy'),
+                         mmap_mode = mmapMode)
+            for key in shard['keys']}
+
+def iterShards(directory):
+    # Yields the dict of arrays of every shard in stream order
+    for shard in getShards(directory):
+        yield loadShard(directory, shard)
+
+def load(directory):
+    # All shards as one dict of arrays, each key concatenated once
+    columns = dict()
+    for d in iterShards(directory):
+        for key in d:
+            columns.setdefault(key, []).append(d[key])
+    return {key: np.concatenate(columns[key], axis = 0) for key in columns}
@@ -64,10 +64,28 @@ class Robot():
         self.role = None
         self.neighbors = []
         self.leader = None # Only for data recording purposes        
+        self.neighborsVersion = None # scene.topologyVersion of self.neighbors
        
         self.ctrl1_sm = []
         self.ctrl2_sm = []
         
+    def __setstate__(self, state):
+        # Robots pickled before the role property keep role in their dict
+        # and have no cached neighbor lists
+        if 'role' in state:
+            state['_role'] = state.pop('role')
+        state.setdefault('neighborsVersion', None)
+        self.__dict__.update(state)
+    
+    @property
+    def role(self):
+        return self._role
+    
+    @role.setter
+    def role(self, role):
+        self._role = role
+        self.scene.topologyVersion += 1 # leaders of the neighbors may change
+        
     def propagateDesired(self):
         if self.dynamics == 5:
             pass
@@ -148,11 +166,14 @@ class Robot():
                                             omega2, vrep.simx_opmode_oneshot)
             
     def updateNeighbors(self):
+        # The lists only depend on the topology and the roles, so they are
+        # rebuilt only after one of them has changed
+        if self.neighborsVersion == self.scene.topologyVersion:
+            return
+        self.neighborsVersion = self.scene.topologyVersion
         self.neighbors = []
         self.leader = None
-        for j in range(len(self.scene.robots)):
-            if self.scene.adjMatrix[self.index, j] == 0:
-                continue
+        for j in self.scene.getNeighborIndices(self.index):
             robot = self.scene.robots[j] # neighbor
             self.neighbors.append(robot)
             if robot.role == self.scene.ROLE_LEADER:
@@ -233,11 +254,20 @@ class Robot():
             
             
             # sort neighbors by distance
-            if True: #not hasattr(self, 'dictDistance'):
+            if self.scene.spatialIndex is not None:
+                # only the candidates near enough to be selected below
+                indptr, indices = self.scene.spatialIndex.getFormationNeighbors(
+                        self.scene.adjMatrix)
+                jCandidates = indices[indptr[self.index]:indptr[self.index+1]]
+                self.dictDistance = dict()
+                for j in jCandidates.tolist():
+                    robot = self.scene.robots[j] # neighbor
+                    self.dictDistance[j] = self.xi.distancepTo(robot.xi)
+                self.listSortedDistance = sorted(self.dictDistance.items(), 
+                                        key=operator.itemgetter(1))
+            else:
                 self.dictDistance = dict()
-                for j in range(len(self.scene.robots)):
-                    if self.scene.adjMatrix[self.index, j] == 0:
-                        continue
+                for j in self.scene.getNeighborIndices(self.index):
                     robot = self.scene.robots[j] # neighbor
                     self.dictDistance[j] = self.xi.distancepTo(robot.xi)
                 self.listSortedDistance = sorted(self.dictDistance.items(), 
@@ -450,6 +480,7 @@ class Robot():
             self.xi.x = x0
             self.xi.y = y0
             self.xi.theta = theta0
+            self.scene.swarm = None # arrays are rebuilt from xi
         else:
             raise Exception('Argument error!')
         if self.scene.vrepConnected == False:
@@ -550,6 +581,8 @@ class Robot():
                 self.pointCloud.crop()
                 #end = time.clock()
                 #self.pointCloud.updateScanVector() # option 2
+                # or options 1 and 2 in one pass instead of crop() and updateOccupancyMap():
+                #self.pointCloud.updateScanVector(occupancyMap = True)
                 self.pointCloud.updateOccupancyMap() # option 1
                 #print('Time elapsed: ', end - start)
             self.VPL16_counter += 1
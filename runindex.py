@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:58:12 2026
+
+Run numbers for the files written to data/, data_scene/ and fig/. The last
+number handed out is kept in a small counter file in the directory, which
+is read and rewritten under an exclusive file lock. A new number costs O(1)
+whatever the number of files, and concurrent writers (e.g. the workers of
+runner.py) never get the same number. The directory is scanned only once,
+when it has no counter file yet, so existing directories continue their
+numbering.
+
+@author: cz
+"""
+
+import os
+import re
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+INDEX_FILE = '.runindex'
+
+def lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+def unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def scanRunNumber(directory, prefix = ''):
+    # Largest number following prefix in the names in directory, 0 if none.
+    # Names that do not match are skipped.
+    pattern = re.compile('^' + re.escape(prefix) + '([0-9]+)')
+    count = 0
+    for filename in os.listdir(directory):
+        match = pattern.match(filename)
+        if match is not None and count < int(match.group(1)):
+            count = int(match.group(1))
+    return count
+
+def nextRunNumber(directory, prefix = ''):
+    # Reserve and return the next run number of directory
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok = True)
+    path = os.path.join(directory, INDEX_FILE)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    with os.fdopen(fd, 'r+') as f:
+        lock(f)
+        try:
+            f.seek(0)
+            text = f.read().strip()
+            if text:
+                count = int(text)
+            else:
+                count = scanRunNumber(directory, prefix)
+            count += 1
+            f.seek(0)
+            f.truncate()
+            f.write(str(count))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            unlock(f)
+    return count
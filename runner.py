@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:03:48 2026
+
+Monte Carlo runner for the data generation episodes of the test5_* scripts.
+Episodes are spread over a process pool, every episode gets its own seed
+(baseSeed + episode number) so a run can be repeated, and the workers only
+send back the recorded columns of each robot. The parent merges them in
+episode order, which gives the same layout as the serial loop, or with
+streamEpisodes() hands them to a recorder.ShardRecorder as they arrive.
+
+The driver script must call runEpisodes()/streamEpisodes() under
+if __name__ == '__main__': and generateData must be defined at module level.
+When connected to vrep keep numWorkers = 1, there is only one simulator.
+
+@author: cz
+"""
+
+import concurrent.futures
+import collections
+import multiprocessing
+import random
+import numpy as np
+import saver
+
+def runEpisode(generateData, i, seed, saveScene = True):
+    random.seed(seed + i)
+    np.random.seed((seed + i) % 2**32)
+    sc = generateData(i)
+    if sc is None:
+        return None
+    if saveScene:
+        saver.save(sc) # run numbers come from runindex, safe across workers
+    # Worker processes exit without running atexit, write the log out now
+    sc.logger.close()
+    # Only the recorded columns of each robot go back to the parent
+    return [robot.data.d for robot in sc.robots]
+
+def iterEpisodes(generateData, numRun, numWorkers = None, seed = None,
+                 saveScene = True):
+    # Yields the payload of every episode in episode order; None for
+    # episodes that failed. numWorkers = None uses all cores. Only a few
+    # episodes per worker are in flight, so finished payloads do not pile up.
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**31)
+    print('Base seed: ', seed)
+    if numWorkers == 1:
+        for i in range(numRun):
+            print('Run #: ', i, '...')
+            yield runEpisode(generateData, i, seed, saveScene)
+        return
+    if numWorkers is None:
+        numWorkers = multiprocessing.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(max_workers = numWorkers) as executor:
+        futures = collections.deque()
+        submitted = 0
+        for i in range(numRun):
+            while submitted < numRun and len(futures) < 2 * numWorkers:
+                futures.append(executor.submit(runEpisode, generateData,
+                                               submitted, seed, saveScene))
+                submitted += 1
+            payload = futures.popleft().result()
+            print('Run #: ', i, 'done')
+            yield payload
+
+def runEpisodes(generateData, numRun, numWorkers = None, seed = None,
+                saveScene = True):
+    # Returns the payload of every episode in episode order
+    return list(iterEpisodes(generateData, numRun, numWorkers, seed, saveScene))
+
+def streamEpisodes(generateData, numRun, recorder, numWorkers = None,
+                   seed = None, saveScene = True):
+    # Hands every robot's rows to recorder (stream = robot index) as soon as
+    # the episode is done instead of merging all episodes in memory. Returns
+    # the number of episodes recorded. The episodes in flight are not in the
+    # recorder yet and are lost on a crash (see recorder.py).
+    count = 0
+    for payload in iterEpisodes(generateData, numRun, numWorkers, seed, saveScene):
+        if payload is None:
+            continue
+        for j in range(len(payload)):
+            recorder.add(payload[j], j)
+        count += 1
+    return count
+
+def mergeData(payloads):
+    # Same order as the serial loop: all episodes of robot 0, then all
+    # episodes of robot 1, ... Every key is concatenated once.
+    payloads = [p for p in payloads if p is not None]
+    if not payloads:
+        return None
+    columns = dict()
+    for j in range(len(payloads[0])):
+        for p in payloads:
+            for key in p[j]:
+                columns.setdefault(key, []).append(p[j][key])
+    d = dict()
+    for key in columns:
+        d[key] = np.concatenate(columns[key], axis = 0)
+    return d
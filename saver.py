@@ -8,19 +8,12 @@ Created on Tue Feb 20 18:33:11 2018
 # save scene
 import pickle
 import os
+import runindex
 
 directory = 'data_scene'
 
 def save(sc):
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    count = 0
-    for filename in os.listdir(directory):
-        name, _ = os.path.splitext(filename)
-        n = int(name[2:])
-        if count < n:
-            count = n
-    count += 1
+    count = runindex.nextRunNumber(directory, 'sc')
     for robot in sc.robots:
         robot.data.q = None
         if robot.learnedController is not None:
@@ -19,11 +19,23 @@ import random
 import datetime
 import os
 from state import State
+from swarmstate import SwarmState, toScalars
+import swarmcontrol
+from spatialindex import GridIndex
+from convergence import ConvergenceMonitor
+from profiler import StepProfiler
+from logger import BufferedLogger
+from metricstore import MetricSeries, toMetricSeries, toMetricSeriesDict
 
 class Scene():
-    def __init__(self, fileName = "Untitled", recordData = False, runNum = 0):
+    def __init__(self, fileName = "Untitled", recordData = False, runNum = 0,
+                 logBinary = False):
         self.t = 0
         self.dt = 0.01
+        # Offline integration of the robot dynamics: 'euler', 'exact' or 'rk4'
+        # (see integrator.py), optionally in sub-steps of integratorDt
+        self.integrator = 'euler'
+        self.integratorDt = None
         
         # formation reference link
         self.xid = State(0.0, 0.0, math.pi / 2)
@@ -31,11 +43,15 @@ class Scene():
         self.alpha = 1 # desired formation scale
         
         # for plots
-        self.ts = [] # timestamps
+        self.ts = MetricSeries() # timestamps
         self.tss = [] # timestamps (sparse)
+        self.centerTraj = None # (t, 2) center of the robots, see calcCOG()
+        self.cogPositions = None
+        self.cogCenter = np.zeros(2)
         self.ydict = dict()
         self.ydict2 = dict()
         self.ploted = dict()
+        self.headless = False # set by run(), skips the plot bookkeeping
         
         # For visualization
         self.wPix = 600
@@ -51,6 +67,28 @@ class Scene():
         self.robots = []
         self.adjMatrix = None
         self.Laplacian = None
+        # CSR form of adjMatrix: neighbors of robot i are
+        # adjIndices[adjIndptr[i]:adjIndptr[i+1]]
+        self.adjIndptr = None
+        self.adjIndices = None
+        self.neighborLists = []
+        # Bumped whenever the adjacency matrix or a robot's role changes so
+        # that cached neighbor lists are rebuilt
+        self.topologyVersion = 0
+        self.edges = None
+        self.edgesVersion = None
+        
+        # Swarm state engine (offline only): robot states kept in numpy arrays
+        self.swarmStateEnabled = False
+        self.swarm = None # SwarmState of xi, rebuilt when robots are moved
+        self.swarmd = None # SwarmState of xid, gathered on every step
+        # Compare the batched controller with Robot.control on every step (slow)
+        self.swarmControlCheck = False
+        
+        # Spatial index over (xp, yp) for neighbor queries in large swarms
+        # (see spatialindex.py for the sizes from which it pays off)
+        self.spatialIndexEnabled = False
+        self.spatialIndex = None
          
         # vrep related
         self.vrepConnected = False
@@ -63,6 +101,8 @@ class Scene():
         self.OCCUPANCY_MAP_BINARY = 0
         # 1 for 3-channel: mean height, height variance, visibility
         self.OCCUPANCY_MAP_THREE_CHANNEL = 1
+        # Store binary maps with one bit per cell (Data key 'observations_packed')
+        self.packObservations = False
         
         # CONSTANTS
         self.dynamics = 11
@@ -82,8 +122,18 @@ class Scene():
         self.ROLE_PEER = 2
         
         self.errorType = 0
+        # Set to a ConvergenceMonitor to end the episode (simulate() returns
+        # False) once the formation has converged
+        self.convergenceMonitor = None
+        # Set to a StepProfiler to time every phase of simulate()
+        self.profiler = None
         self.logPriorityMax = 1 # Messages with lower priorities are not logged
-        self.logFileName = os.path.splitext(fileName)[0] + ".log"
+        if logBinary:
+            self.logFileName = os.path.splitext(fileName)[0] + ".logb"
+        else:
+            self.logFileName = os.path.splitext(fileName)[0] + ".log"
+        # Records are written in batches by a background thread, see logger.py
+        self.logger = BufferedLogger(self.logFileName, binary = logBinary)
         self.runNum = runNum
         self.log('A new scene is created for run #' + str(runNum))
         
@@ -114,6 +164,9 @@ class Scene():
             robot.recordData = self.recordData
         
         self.robots.append(robot)
+        self.topologyVersion += 1
+        self.swarm = None
+        self.swarmd = None
         
         message = ""
         if robot.role == 0:
@@ -132,9 +185,54 @@ class Scene():
         message += " is added to the scene"
         self.log(message)
     
+    def __setstate__(self, state):
+        # Attributes added after a scene was pickled get their defaults
+        defaults = {'integrator': 'euler', 'integratorDt': None,
+                    'centerTraj': None, 'cogPositions': None,
+                    'headless': False, 'adjIndptr': None, 'adjIndices': None,
+                    'edges': None, 'edgesVersion': None,
+                    'swarmStateEnabled': False, 'swarm': None, 'swarmd': None,
+                    'swarmControlCheck': False,
+                    'spatialIndexEnabled': False, 'spatialIndex': None,
+                    'packObservations': False, 'convergenceMonitor': None,
+                    'profiler': None}
+        for key, value in defaults.items():
+            setattr(self, key, value)
+        self.cogCenter = np.zeros(2)
+        self.__dict__.update(state)
+        if 'logger' not in state:
+            binary = os.path.splitext(self.logFileName)[1] == '.logb'
+            self.logger = BufferedLogger(self.logFileName, binary = binary)
+        # Scenes pickled before the CSR adjacency have no neighbor lists
+        if 'topologyVersion' not in state:
+            self.topologyVersion = 0
+            self.neighborLists = []
+            if self.adjMatrix is not None:
+                self.setADjMatrix(self.adjMatrix)
+        # Plot data pickled before MetricSeries is in lists and arrays
+        if not isinstance(self.ts, MetricSeries):
+            self.ts = toMetricSeries(self.ts)
+            self.centerTraj = toMetricSeries(self.centerTraj)
+            if hasattr(self, 'centerTrajS'):
+                self.centerTrajS = toMetricSeries(self.centerTrajS)
+            toMetricSeriesDict(self.ydict)
+            toMetricSeriesDict(self.ydict2)
+    
     def setADjMatrix(self, adjMatrix):
+        # Always go through this method so that the cached neighbor lists are
+        # invalidated; the matrix should not be modified in place afterwards
         self.adjMatrix = adjMatrix
         self.Laplacian = np.diag(np.sum(self.adjMatrix, axis = 1))
+        rows, cols = np.nonzero(self.adjMatrix)
+        self.adjIndptr = np.searchsorted(rows, np.arange(self.adjMatrix.shape[0] + 1))
+        self.adjIndices = cols
+        self.neighborLists = [cols[self.adjIndptr[i]:self.adjIndptr[i+1]].tolist()
+                              for i in range(self.adjMatrix.shape[0])]
+        self.topologyVersion += 1
+    
+    def getNeighborIndices(self, i):
+        # Indices of robot i's neighbors in ascending order
+        return self.neighborLists[i]
     
     def initVrep(self):
         print ('Program started')
@@ -345,45 +443,314 @@ class Scene():
         if cmd == 'q': # quit
             return False
         '''
+        if self.swarmStateEnabled and not self.vrepConnected:
+            return self.simulateSwarm()
+        prof = self.profiler # phases are timed when a StepProfiler is set
+        if prof is not None:
+            t0 = prof.beginStep()
         self.t += self.dt
-        self.ts.append(self.t)
+        if not self.headless:
+            self.ts.append(self.t)
         self.propagateXid()
+        if prof is not None:
+            t0 = prof.toc('propagateXid', t0)
         countReachedGoal = 0
         for robot in self.robots:
             robot.precompute()
+            if prof is not None:
+                t0 = prof.toc('precompute', t0, robot.index)
+        self.updateSpatialIndex()
+        if prof is not None:
+            t0 = prof.toc('updateSpatialIndex', t0)
         for robot in self.robots:
             robot.readSensorData()
+            if prof is not None:
+                t0 = prof.toc('readSensorData', t0, robot.index)
             robot.propagateDesired()
+            if prof is not None:
+                t0 = prof.toc('propagateDesired', t0, robot.index)
             robot.propagate()
+            if prof is not None:
+                t0 = prof.toc('propagate/control', t0, robot.index)
             if robot.reachedGoal:
                 countReachedGoal += 1
-        self.calcCOG()
+        if not self.headless:
+            self.calcCOG()
+            if prof is not None:
+                t0 = prof.toc('calcCOG', t0)
         
         if self.vrepConnected:
             vrep.simxSynchronousTrigger(self.clientID);
+            if prof is not None:
+                t0 = prof.toc('simxSynchronousTrigger', t0)
+        running = self.isRunning(countReachedGoal)
+        if prof is not None:
+            prof.toc('checkConvergence', t0)
+            prof.endStep()
+        return running
+        
+    def simulateSwarm(self):
+        # Same step as simulate(), but the robots' xi live in self.swarm and
+        # are transformed and propagated in one batched update each
+        prof = self.profiler
+        if prof is not None:
+            t0 = prof.beginStep()
+        if self.swarm is None:
+            self.swarm = SwarmState.fromStates([robot.xi for robot in self.robots])
+        swarm = self.swarm
+        states = [robot.xi for robot in self.robots]
+        self.t += self.dt
+        if not self.headless:
+            self.ts.append(self.t)
+        self.propagateXid()
+        if prof is not None:
+            t0 = prof.toc('propagateXid', t0)
+        swarm.transform()
+        swarm.scatter(states)
+        for robot in self.robots:
+            robot.xid.transform()
+            robot.updateNeighbors()
+        if prof is not None:
+            t0 = prof.toc('precompute', t0)
+        self.updateSpatialIndex()
+        if prof is not None:
+            t0 = prof.toc('updateSpatialIndex', t0)
+        countReachedGoal = 0
+        if self.isSwarmControlApplicable():
+            for robot in self.robots:
+                robot.propagateDesired()
+                if robot.reachedGoal:
+                    countReachedGoal += 1
+            if prof is not None:
+                t0 = prof.toc('propagateDesired', t0)
+            v1, v2 = self.controlSwarm()
+            if prof is not None:
+                t0 = prof.toc('control', t0)
+        else:
+            v1 = np.zeros(len(self.robots))
+            v2 = np.zeros(len(self.robots))
+            for robot in self.robots:
+                robot.propagateDesired()
+                if prof is not None:
+                    t0 = prof.toc('propagateDesired', t0, robot.index)
+                v1[robot.index], v2[robot.index] = robot.control()
+                if prof is not None:
+                    t0 = prof.toc('control', t0, robot.index)
+                if robot.reachedGoal:
+                    countReachedGoal += 1
+        swarm.propagate(v1, v2, self.dt, self.integrator, self.integratorDt)
+        swarm.scatter(states)
+        if prof is not None:
+            t0 = prof.toc('propagate', t0)
+        if not self.headless:
+            self.calcCOG()
+            if prof is not None:
+                t0 = prof.toc('calcCOG', t0)
+        running = self.isRunning(countReachedGoal)
+        if prof is not None:
+            prof.toc('checkConvergence', t0)
+            prof.endStep()
+        return running
+    
+    def isRunning(self, countReachedGoal):
+        # False once every robot has reached its goal or the formation converged
         if countReachedGoal == len(self.robots):
             return False
+        elif self.convergenceMonitor is not None and self.checkConvergence():
+            return False
         else:
             return True
+    
+    def checkConvergence(self):
+        # Feed the convergence monitor with the edge errors and the robots'
+        # velocities of this step
+        errors = self.getFormationErrors()
+        if self.vrepConnected:
+            v = np.array([robot.vActual for robot in self.robots])
+        else:
+            v = np.array([(robot.v1Desired + robot.v2Desired) / 2 
+                          for robot in self.robots])
+        if self.swarm is not None and self.swarmStateEnabled:
+            theta = self.swarm.theta
+        else:
+            theta = np.array([robot.xi.theta for robot in self.robots])
+        converged = self.convergenceMonitor.update(self.t, errors, 
+                                                   v * np.cos(theta), 
+                                                   v * np.sin(theta))
+        if converged:
+            message = "Formation converged, maxAbsError = {0:.3f} m"
+            self.log(message.format(self.convergenceMonitor.maxAbsError))
+        return converged
+    
+    def run(self, numSteps = None, tf = None, metrics = (), decimation = 1):
+        # Headless fast-forward: advance numSteps steps and/or until t > tf.
+        # Visualization, plot bookkeeping (ts, centerTraj) and logging are
+        # skipped; only the requested metrics are recorded, every decimation
+        # steps:
+        #   'formationError': max absolute separation error (as plot type 2)
+        #   'states': (N, 3) [x, y, theta] of every robot
+        #   'actions': (N, 2) [v1Desired, v2Desired] of every robot
+        #   'center': [x, y] center of gravity
+        # Returns a dict of numpy arrays, including the sample times 't'.
+        if numSteps is None and tf is None:
+            raise Exception('Either numSteps or tf must be given!')
+        records = dict()
+        records['t'] = []
+        for name in metrics:
+            if name not in ('formationError', 'states', 'actions', 'center'):
+                raise Exception('Undefined metric', name)
+            records[name] = []
+        logPriorityMax = self.logPriorityMax
+        self.logPriorityMax = -1 # nothing is logged
+        self.headless = True
+        k = 0
+        try:
+            while numSteps is None or k < numSteps:
+                running = self.simulate()
+                k += 1
+                if k % decimation == 0:
+                    self.recordMetrics(records)
+                if not running or (tf is not None and self.t > tf):
+                    break
+        finally:
+            self.headless = False
+            self.logPriorityMax = logPriorityMax
+        for name in records:
+            records[name] = np.array(records[name])
+        return records
+    
+    def recordMetrics(self, records):
+        records['t'].append(self.t)
+        if 'formationError' in records:
+            records['formationError'].append(np.max(np.fabs(self.getFormationErrors())))
+        if 'states' in records or 'center' in records:
+            if self.swarm is not None and self.swarmStateEnabled:
+                states = np.stack((self.swarm.x, self.swarm.y, self.swarm.theta), axis = -1)
+            else:
+                states = np.array([[robot.xi.x, robot.xi.y, robot.xi.theta] 
+                                   for robot in self.robots])
+            if 'states' in records:
+                records['states'].append(states)
+            if 'center' in records:
+                records['center'].append(np.mean(states[:, 0:2], axis = 0))
+        if 'actions' in records:
+            records['actions'].append([[robot.v1Desired, robot.v2Desired] 
+                                       for robot in self.robots])
+    
+    def getEdges(self):
+        # Edges (i, j) of the formation, in the order of plot type 2: every
+        # pair once, and one-way links as well
+        if self.edgesVersion != self.topologyVersion:
+            self.edgesVersion = self.topologyVersion
+            edges = []
+            for i in range(len(self.robots)):
+                for j in self.getNeighborIndices(i):
+                    if i > j and self.adjMatrix[j, i] != 0:
+                        continue
+                    edges.append((i, j))
+            self.edges = np.array(edges, dtype = np.int64).reshape((-1, 2))
+        return self.edges
+    
+    def getFormationErrors(self):
+        # Separation error of every edge, as in plot type 2
+        edges = self.getEdges()
+        if self.swarm is not None and self.swarmStateEnabled:
+            x = self.swarm.x
+            y = self.swarm.y
+        else:
+            x = np.array([robot.xi.x for robot in self.robots])
+            y = np.array([robot.xi.y for robot in self.robots])
+        i = edges[:, 0]
+        j = edges[:, 1]
+        eji = ((x[i] - x[j])**2 + (y[i] - y[j])**2)**0.5
+        if self.dynamics == 5 or self.dynamics == 17:
+            xd = np.array([robot.xid.x for robot in self.robots])
+            yd = np.array([robot.xid.y for robot in self.robots])
+            ejid = ((xd[i] - xd[j])**2 + (yd[i] - yd[j])**2)**0.5
+        else:
+            ejid = self.alpha
+        return eji - ejid
+        
+    def updateSpatialIndex(self):
+        # Rebuild the grid once per step, after the robots' xi are transformed
+        if not self.spatialIndexEnabled:
+            self.spatialIndex = None
+            return
+        if self.spatialIndex is None:
+            self.spatialIndex = GridIndex()
+        if self.swarm is not None and self.swarmStateEnabled:
+            self.spatialIndex.build(self.swarm.xp, self.swarm.yp)
+        else:
+            self.spatialIndex.build([robot.xi.xp for robot in self.robots],
+                                    [robot.xi.yp for robot in self.robots])
+    
+    def isSwarmControlApplicable(self):
+        # The batched controller covers the model-based distance formation
+        # controllers only.
+        if self.dynamics < 15 or self.dynamics > 18:
+            return False
+        for robot in self.robots:
+            if robot.learnedController is not None:
+                return False
+        return True
+    
+    def controlSwarm(self):
+        # Batched Robot.control for all robots, xid is read after
+        # propagateDesired() but, like there, transformed before it
+        xids = [robot.xid for robot in self.robots]
+        if self.swarmd is None:
+            self.swarmd = SwarmState.fromStates(xids, transformed = True)
+        else:
+            self.swarmd.gather(xids, transformed = True)
+        roles = [robot.role for robot in self.robots]
+        candidates = None
+        if self.spatialIndex is not None:
+            # select the neighbors among the candidates of the grid only
+            candidates = self.spatialIndex.getFormationNeighbors(self.adjMatrix)
+        v1, v2 = swarmcontrol.control(self.swarm, self.swarmd, self.adjMatrix,
+                                      roles, self.dynamics, self.alpha,
+                                      self.xid.dpbarx, self.xid.dpbary,
+                                      candidates)
+        v1Desired = np.array([robot.v1Desired for robot in self.robots])
+        v2Desired = np.array([robot.v2Desired for robot in self.robots])
+        v1, v2 = swarmcontrol.limitAcceleration(v1, v2, v1Desired, v2Desired, self.dt)
+        if self.swarmControlCheck:
+            self.checkSwarmControl(v1, v2)
+        for robot, v1i, v2i in zip(self.robots, toScalars(v1), toScalars(v2)):
+            robot.v1Desired = v1i
+            robot.v2Desired = v2i
+        return v1, v2
+    
+    def checkSwarmControl(self, v1, v2):
+        # Raise if the batched wheel speeds differ in any bit or in type from
+        # those of Robot.control; the robots' xi must be in sync (scatter)
+        for robot in self.robots:
+            v1i, v2i = robot.control()
+            i = robot.index
+            if (np.asarray(v1i).dtype != v1.dtype or v1i != v1[i] or
+                np.asarray(v2i).dtype != v2.dtype or v2i != v2[i]):
+                raise Exception('controlSwarm differs from Robot.control for robot', 
+                                i, (v1[i], v2[i]), (v1i, v2i))
         
     def calcCOG(self):
-        # Calculate Center Of Gravity
-        for i in range(len(self.robots)):
-            x = self.robots[i].xi.x
-            y = self.robots[i].xi.y
-            if len(self.ts) == 1:
-                if i == 0:
-                    self.centerTraj = np.array([[x, y]])
-                else:
-                    self.centerTraj += np.array([[x, y]])
-            else:
-                if i == 0:
-                    self.centerTraj = np.append(self.centerTraj, [[x, y]], axis = 0)
-                else:
-                    #print('size', self.centerTraj.shape)
-                    self.centerTraj[-1, :] += np.array([x, y])
-            #print(self.centerTraj)
-        self.centerTraj[-1, :] /= len(self.robots)
+        # Calculate Center Of Gravity; the robot positions are copied into a
+        # preallocated (N, 2) buffer and summed in robot order as before
+        n = len(self.robots)
+        if self.cogPositions is None or len(self.cogPositions) != n:
+            self.cogPositions = np.zeros((n, 2))
+        positions = self.cogPositions
+        if self.swarm is not None and self.swarmStateEnabled:
+            positions[:, 0] = self.swarm.x
+            positions[:, 1] = self.swarm.y
+        else:
+            for i in range(n):
+                positions[i, 0] = self.robots[i].xi.x
+                positions[i, 1] = self.robots[i].xi.y
+        if len(self.ts) == 1 or self.centerTraj is None:
+            self.centerTraj = MetricSeries(2) # trajectory of a new run
+        np.sum(positions, axis = 0, out = self.cogCenter)
+        self.cogCenter /= n
+        self.centerTraj.append(self.cogCenter)
          
     def renderScene(self, timestep = -1, waitTime = 25, mode = 0):
         if USE_CV2 == False:
@@ -441,7 +808,7 @@ class Scene():
                              self.occupancyMap.shape[0] * resizeFactor),
                             interpolation = cv2.INTER_NEAREST)
             cv2.imshow('Occupancy Map', im)
-        elif self.occupancyMap == self.OCCUPANCY_MAP_THREE_CHANNEL:
+        elif self.occupancyMapType == self.OCCUPANCY_MAP_THREE_CHANNEL:
             self.occupancyMap = np.zeros((hPix, (wPix+1) * N, 3), np.uint8)
             x0 = 0
             for robot in self.robots:
@@ -490,6 +857,7 @@ class Scene():
     
     def deallocate(self):
         self.log("Scene is destructed")
+        self.logger.close()
         if USE_CV2 == True:
             cv2.destroyAllWindows() # Add this to fix the window freezing bug
             self.out.release()
@@ -506,12 +874,7 @@ class Scene():
             
     def log(self, message, priority=1):
         if priority <= self.logPriorityMax:
-            with open(self.logFileName, "a+" ) as f:
-                prefix = ("[" + str(datetime.datetime.now()) + "]"
-                            + " [run #{0:03d}]"
-                            + " [sim time: {1:.3f} s] ")
-                prefix = prefix.format(self.runNum, self.t)
-                f.write(prefix + message + '\n')
+            self.logger.write(self.runNum, self.t, message)
     
     
     
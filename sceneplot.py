@@ -9,12 +9,16 @@ import matplotlib.pyplot as plt
 import numpy as np
 import math
 import os
+import runindex
+from metricstore import MetricSeries, getMemoryUsage
 
 
 
 class ScenePlot():
-    def __init__(self, scene = None, saveEnabled = True):
+    def __init__(self, scene = None, saveEnabled = True, decimation = 1):
         self.sc = scene
+        # Metrics are recorded every decimation-th step of the scene
+        self.decimation = decimation
         self.TYPE_TIME_SEPARATION_ERROR = 2
         self.TYPE_TIME_BEARING_ERROR = 3
         self.TYPE_TIME_ACTIONS = 6
@@ -23,23 +27,39 @@ class ScenePlot():
         self.saveEnabled = saveEnabled
         if self.saveEnabled == True:
             directory = 'fig'
-            if not os.path.exists(directory):
-                os.makedirs(directory)
             self.directory = directory
             
-            count = 0
-            for filename in os.listdir(directory):
-                name, _ = os.path.splitext(filename)
-                n = int(name)
-                if count < n:
-                    count = n
-            count = count + 1
+            count = runindex.nextRunNumber(directory)
             self.directory = os.path.join(self.directory, str(count).zfill(3))
             os.makedirs(self.directory)
             
             
     
         
+    def isRecording(self, type):
+        # Whether plot() records a sample of this type at the current step
+        if self.sc.ploted[type]:
+            return False
+        step = len(self.sc.ts) - 1 # -1 before the first step
+        return step < 0 or step % self.decimation == 0
+    
+    def getTimes(self):
+        # Time stamps of the recorded samples
+        return self.sc.ts.view()[0::self.decimation]
+    
+    def getMemoryUsage(self):
+        # {series name: (bytes in use, bytes allocated)} of all series
+        usage = {('ts',): self.sc.ts.getMemoryUsage()}
+        usage.update(getMemoryUsage({'ydict': self.sc.ydict, 'ydict2': self.sc.ydict2}))
+        return usage
+    
+    def printMemoryUsage(self):
+        total = 0
+        for name, (used, allocated) in self.getMemoryUsage().items():
+            print('{0:<24s}{1:>12d}{2:>12d}'.format(str(name), used, allocated))
+            total += allocated
+        print('Total allocated: {0:d} bytes'.format(total))
+        
     def plot(self, type = 0, tf = 0):
         # type 0: (t, x_i - x_id)
         # type 1: (t, y_i - y_id)
@@ -53,12 +73,12 @@ class ScenePlot():
             self.sc.ploted[type] = False 
             if type == 0 or type == 1:
                 for i in range(len(self.sc.robots)):
-                    self.sc.ydict[type][i] = []
+                    self.sc.ydict[type][i] = MetricSeries()
             
         if self.sc.ploted[type] and type != 6:
             pass#return # This type of plot is completed
         if type == 0:
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 for i in range(len(self.sc.robots)):
                     x = self.sc.robots[i].xi.x - self.sc.robots[i].xid.x
                     self.sc.ydict[type][i].append(x)
@@ -66,7 +86,7 @@ class ScenePlot():
                 plt.figure(type)
                 for i in range(len(self.sc.robots)):
                     try:
-                        plt.plot(self.sc.ts, self.sc.ydict[type][i], '-')
+                        plt.plot(self.getTimes(), self.sc.ydict[type][i], '-')
                     except:
                         print('type: ', type)
                         raise
@@ -74,19 +94,19 @@ class ScenePlot():
                 plt.ylabel('x_i - x_di (m)')
                 
         elif type == 1:
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 for i in range(len(self.sc.robots)):
                     x = self.sc.robots[i].xi.y - self.sc.robots[i].xid.y
                     self.sc.ydict[type][i].append(x)
             if self.sc.t > tf:
                 plt.figure(type)
                 for i in range(len(self.sc.robots)):
-                    plt.plot(self.sc.ts, self.sc.ydict[type][i], '-')
+                    plt.plot(self.getTimes(), self.sc.ydict[type][i], '-')
                 plt.xlabel('t (s)')
                 plt.ylabel('y_i - y_di (m)')
                 
         elif type == 2: # Formation Error type 2
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 k = 0
                 for i in range(0, len(self.sc.robots)):
                     xi = self.sc.robots[i].xi.x
@@ -126,7 +146,7 @@ class ScenePlot():
                         
                         # If this is the first time this type of plot is drawn
                         if k not in self.sc.ydict[type].keys():
-                            self.sc.ydict[type][k] = []
+                            self.sc.ydict[type][k] = MetricSeries()
                             self.sc.ydict2[type][k] = (i, j) # for legend
                         self.sc.ydict[type][k].append(error)
                         
@@ -138,7 +158,7 @@ class ScenePlot():
                 curves = []
                 plt.figure(type)
                 for k in range(0, len(self.sc.ydict[type])):
-                    curve, = plt.plot(self.sc.ts, errors[k], '-', label = str(legends[k]))
+                    curve, = plt.plot(self.getTimes(), errors[k], '-', label = str(legends[k]))
                     curves.append(curve)
                 if int(matplotlib.__version__[0]) == 2:
                     plt.legend(handles = curves)
@@ -146,7 +166,7 @@ class ScenePlot():
                 plt.ylabel('Formation Separation Error (m)')
 
         elif type == 21: # Formation orientation error
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 k = 0
                 for i in range(1, len(self.sc.robots)):
                     xi = self.sc.robots[i].xi.x
@@ -173,7 +193,7 @@ class ScenePlot():
                         
                         # If this is the first time this type of plot is drawn
                         if k not in self.sc.ydict[type].keys():
-                            self.sc.ydict[type][k] = []
+                            self.sc.ydict[type][k] = MetricSeries()
                             self.sc.ydict2[type][k] = (i, j) # for legend
                         self.sc.ydict[type][k].append(angle)
                         
@@ -185,7 +205,7 @@ class ScenePlot():
                 curves = []
                 plt.figure(type)
                 for k in range(0, len(self.sc.ydict[type])):
-                    curve, = plt.plot(self.sc.ts, errors[k], '-', label = str(legends[k]))
+                    curve, = plt.plot(self.getTimes(), errors[k], '-', label = str(legends[k]))
                     curves.append(curve)
                 if int(matplotlib.__version__[0]) == 2:
                     plt.legend(handles = curves)
@@ -193,11 +213,11 @@ class ScenePlot():
                 plt.ylabel('Formation Orientation Error (rad)')
 
         elif type == 22: # Distance from goal
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 for i in range(0, len(self.sc.robots)):
                     # If this is the first time this type of plot is drawn
                     if i not in self.sc.ydict[type].keys():
-                        self.sc.ydict[type][i] = []
+                        self.sc.ydict[type][i] = MetricSeries()
                         # print(self.sc.ydict[type].keys())
                         # print('i = ', i, 'j = ', j)
                     xi = self.sc.robots[i].xi.x
@@ -213,15 +233,15 @@ class ScenePlot():
                 errors = self.sc.ydict[type]
                 plt.figure(type)
                 for i in range(0, len(self.sc.robots)):
-                    plt.plot(self.sc.ts, errors[i], '-')
+                    plt.plot(self.getTimes(), errors[i], '-')
                 plt.xlabel('t (s)')
                 plt.ylabel('Distance from goal (m)')
 
         elif type == 23: # Ceter distance from goal
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 # If this is the first time this type of plot is drawn
                 if 0 not in self.sc.ydict[type].keys():
-                    self.sc.ydict[type][0] = []
+                    self.sc.ydict[type][0] = MetricSeries()
                 xbar = 0
                 ybar = 0                
                 for i in range(0, len(self.sc.robots)):
@@ -238,7 +258,7 @@ class ScenePlot():
             if self.sc.t > tf:
                 error = self.sc.ydict[type][0]
                 plt.figure(type)
-                plt.plot(self.sc.ts, error, '-', color = (0,0,0))
+                plt.plot(self.getTimes(), error, '-', color = (0,0,0))
                 plt.xlabel('t (s)')
                 plt.ylabel('Center distance from goal (m)')
         
@@ -249,7 +269,7 @@ class ScenePlot():
                 raise Exception("Plot type 24 is valid only for dynamics 13.")
             xi = 3 * [None]
             xid = 3 * [None]
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 for i in range(0, 3):
                     xi[i] = self.sc.robots[i].xi
                     xid[i] = self.sc.robots[i].xid
@@ -277,7 +297,7 @@ class ScenePlot():
                     
                     # If this is the first time this type of plot is drawn
                     if i not in self.sc.ydict[type].keys():
-                        self.sc.ydict[type][i] = []
+                        self.sc.ydict[type][i] = MetricSeries()
                         self.sc.ydict2[type][i] = i # for legend
                     self.sc.ydict[type][i].append(epsilon)
             if self.sc.t > tf:
@@ -286,7 +306,7 @@ class ScenePlot():
                 curves = []
                 plt.figure(type)
                 for k in range(0, len(self.sc.ydict[type])):
-                    curve, = plt.plot(self.sc.ts, errors[k], '-', 
+                    curve, = plt.plot(self.getTimes(), errors[k], '-', 
                                       label = str(legends[k]))
                     curves.append(curve)
                 if int(matplotlib.__version__[0]) == 2:
@@ -295,11 +315,11 @@ class ScenePlot():
                 plt.ylabel('Formation Separation Error (m)')
                         
         elif type == 3: # Formation Error type 3
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 for i in range(1, len(self.sc.robots)):
                     # If this is the first time this type of plot is drawn
                     if i not in self.sc.ydict[type].keys():
-                        self.sc.ydict[type][i] = []
+                        self.sc.ydict[type][i] = MetricSeries()
                         # print(self.sc.ydict[type].keys())
                         # print('i = ', i, 'j = ', j)
                     xi = self.sc.robots[i].xi.x
@@ -326,7 +346,7 @@ class ScenePlot():
                 errors = self.sc.ydict[type]
                 plt.figure(type)
                 for i in range(1, len(self.sc.robots)):
-                    plt.plot(self.sc.ts, errors[i], '-')
+                    plt.plot(self.getTimes(), errors[i], '-')
                 plt.xlabel('t (s)')
                 plt.ylabel('Bearing Error (rad)')
         
@@ -334,38 +354,29 @@ class ScenePlot():
             # Show formation
             if not self.sc.ploted[type]:
                 # record individual trajectories
-                for i in range(len(self.sc.robots)):
-                    x = self.sc.robots[i].xi.x
-                    y = self.sc.robots[i].xi.y
-                    if i not in self.sc.ydict[type].keys():
-                        self.sc.ydict2[type][i] = np.array([[x, y]])
-                    else: 
-                        self.sc.ydict2[type][i] = np.append(self.sc.ydict2[type][i], 
-                                   [[x, y]], axis = 0)
+                if self.isRecording(type):
+                    for i in range(len(self.sc.robots)):
+                        if i not in self.sc.ydict2[type].keys():
+                            self.sc.ydict2[type][i] = MetricSeries(2)
+                        self.sc.ydict2[type][i].append((self.sc.robots[i].xi.x,
+                                                        self.sc.robots[i].xi.y))
                         
                 # print('time: ', (self.sc.t + 1e-5) % 1)
                 if (self.sc.t + 1e-5) % 3 < 2e-5:
                     # print("recording")
                     self.sc.tss.append(self.sc.t)
+                    positions = np.zeros((len(self.sc.robots), 2))
                     for i in range(len(self.sc.robots)):
                         x = self.sc.robots[i].xi.x
                         y = self.sc.robots[i].xi.y
                         theta = self.sc.robots[i].xi.theta*180/math.pi - 90 # convert to deg
-                        if len(self.sc.tss) == 1:
-                            self.sc.ydict[type][i] = np.array([[x, y, theta]])
-                            if i == 0:
-                                self.sc.centerTrajS = np.array([[x, y]])
-                            else:
-                                self.sc.centerTrajS += np.array([[x, y]])
-                        else:
-                            self.sc.ydict[type][i] = np.append(self.sc.ydict[type][i], 
-                                      [[x, y, theta]], axis = 0)
-                            if i == 0:
-                                self.sc.centerTrajS = np.append(self.sc.centerTrajS, [[x, y]], axis = 0)
-                            else:
-                                self.sc.centerTrajS[-1, :] += np.array([x, y])
-                        #print(self.sc.centerTrajS)
-                    self.sc.centerTrajS[-1, :] /= len(self.sc.robots)
+                        if i not in self.sc.ydict[type].keys():
+                            self.sc.ydict[type][i] = MetricSeries(3)
+                        self.sc.ydict[type][i].append((x, y, theta))
+                        positions[i] = (x, y)
+                    if len(self.sc.tss) == 1:
+                        self.sc.centerTrajS = MetricSeries(2)
+                    self.sc.centerTrajS.append(np.mean(positions, axis = 0))
                 
             # Show Figure
             if self.sc.t > tf:
@@ -424,7 +435,7 @@ class ScenePlot():
         
         elif type == 5:
             # Show speed
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 for i in range(len(self.sc.robots)):
                     vDesired = (self.sc.robots[i].v1Desired + self.sc.robots[i].v2Desired)/2
                     if self.sc.vrepConnected ==  True:
@@ -432,17 +443,17 @@ class ScenePlot():
                     else:
                         vActual = vDesired
                     if i not in self.sc.ydict[type].keys():
-                        self.sc.ydict[type][i] = []
-                        self.sc.ydict2[type][i] = []
+                        self.sc.ydict[type][i] = MetricSeries()
+                        self.sc.ydict2[type][i] = MetricSeries()
                     self.sc.ydict[type][i].append(vActual)
                     self.sc.ydict2[type][i].append(vDesired)
             if self.sc.t > tf:
                 plt.figure(type)
                 for i in range(len(self.sc.robots)):
                     c = self.getRobotColor(i)
-                    curve1, = plt.plot(self.sc.ts, self.sc.ydict[type][i], '-', 
+                    curve1, = plt.plot(self.getTimes(), self.sc.ydict[type][i], '-', 
                                       color = c, label = 'Actual')
-                    curve2, = plt.plot(self.sc.ts, self.sc.ydict2[type][i], '--', 
+                    curve2, = plt.plot(self.getTimes(), self.sc.ydict2[type][i], '--', 
                                       color = c, label = 'Desired')
                 if int(matplotlib.__version__[0]) == 2:
                     plt.legend(handles = [curve1, curve2])
@@ -457,13 +468,13 @@ class ScenePlot():
                 j1 = 0
             else:
                 j1 = 0
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 for i in range(len(self.sc.robots)):
                     vDesired1 = self.sc.robots[i].v1Desired
                     vDesired2 = self.sc.robots[i].v2Desired
                     if i not in self.sc.ydict[type].keys():
-                        self.sc.ydict[type][i] = []
-                        self.sc.ydict2[type][i] = []
+                        self.sc.ydict[type][i] = MetricSeries()
+                        self.sc.ydict2[type][i] = MetricSeries()
                     self.sc.ydict[type][i].append(vDesired1)
                     self.sc.ydict2[type][i].append(vDesired2)
             if self.sc.t > tf:
@@ -477,9 +488,9 @@ class ScenePlot():
                     else:
                         curve1Label = 'Left Wheel Velocity'
                         curve2Label = 'Right Wheel Velocity'
-                    curve1, = plt.plot(self.sc.ts, self.sc.ydict[type][i], ':', 
+                    curve1, = plt.plot(self.getTimes(), self.sc.ydict[type][i], ':', 
                                       color = c, label = curve1Label)
-                    curve2, = plt.plot(self.sc.ts, self.sc.ydict2[type][i], '--', 
+                    curve2, = plt.plot(self.getTimes(), self.sc.ydict2[type][i], '--', 
                                       color = c, label = curve2Label)
                 if int(matplotlib.__version__[0]) == 2:
                     plt.legend(handles = [curve1, curve2])
@@ -488,7 +499,7 @@ class ScenePlot():
                 
         elif type == 7:
             # Show angular velocity
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 for i in range(len(self.sc.robots)):
                     omegaDesired = (self.sc.robots[i].v2Desired - 
                                     self.sc.robots[i].v1Desired) / self.sc.robots[i].l
@@ -497,17 +508,17 @@ class ScenePlot():
                     else:
                         omegaActual = omegaDesired
                     if i not in self.sc.ydict[type].keys():
-                        self.sc.ydict[type][i] = []
-                        self.sc.ydict2[type][i] = []
+                        self.sc.ydict[type][i] = MetricSeries()
+                        self.sc.ydict2[type][i] = MetricSeries()
                     self.sc.ydict[type][i].append(omegaActual)
                     self.sc.ydict2[type][i].append(omegaDesired)
             if self.sc.t > tf:
                 plt.figure(type)
                 for i in range(len(self.sc.robots)):
                     c = self.getRobotColor(i)
-                    curve1, = plt.plot(self.sc.ts, self.sc.ydict[type][i], '-', 
+                    curve1, = plt.plot(self.getTimes(), self.sc.ydict[type][i], '-', 
                                       color = c, label = 'Actual')
-                    curve2, = plt.plot(self.sc.ts, self.sc.ydict2[type][i], '--', 
+                    curve2, = plt.plot(self.getTimes(), self.sc.ydict2[type][i], '--', 
                                       color = c, label = 'Desired')
                 if int(matplotlib.__version__[0]) == 2:
                     plt.legend(handles = [curve1, curve2])
@@ -516,26 +527,26 @@ class ScenePlot():
         
         elif type == 8:
             # Show Euler angles
-            if not self.sc.ploted[type]:
+            if self.isRecording(type):
                 if self.sc.vrepConnected ==  False:
                     return
                 for i in range(len(self.sc.robots)):
                     alpha = self.sc.robots[i].xi.alpha / math.pi * 180
                     beta = self.sc.robots[i].xi.beta / math.pi * 180
                     if i not in self.sc.ydict[type].keys():
-                        self.sc.ydict[type][i] = []
-                        self.sc.ydict2[type][i] = []
+                        self.sc.ydict[type][i] = MetricSeries()
+                        self.sc.ydict2[type][i] = MetricSeries()
                     self.sc.ydict[type][i].append(alpha)
                     self.sc.ydict2[type][i].append(beta)
             if self.sc.t > tf:
-                if len(self.sc.ts) != len(self.sc.ydict[type][0]):
+                if len(self.getTimes()) != len(self.sc.ydict[type][0]):
                     return
                 plt.figure(type)
                 for i in range(len(self.sc.robots)):
                     c = self.getRobotColor(i)
-                    curve1, = plt.plot(self.sc.ts, self.sc.ydict[type][i], '-', 
+                    curve1, = plt.plot(self.getTimes(), self.sc.ydict[type][i], '-', 
                                       color = c, label = 'alpha')
-                    curve2, = plt.plot(self.sc.ts, self.sc.ydict2[type][i], '--', 
+                    curve2, = plt.plot(self.getTimes(), self.sc.ydict2[type][i], '--', 
                                       color = c, label = 'beta')
                 if int(matplotlib.__version__[0]) == 2:
                     plt.legend(handles = [curve1, curve2])
@@ -7,6 +7,7 @@ Created on Mon Nov 20 12:38:54 2017
 
 import sys
 import math
+import integrator
 
 class State():
     def __init__(self, x, y, theta, robot = None):
@@ -30,9 +31,18 @@ class State():
         elif self.robot.dynamics >= 10:
             l = self.robot.l
             v1, v2 = control()
-            self.x += math.cos(self.theta) * dt / 2 * (v1 + v2)
-            self.y += math.sin(self.theta) * dt / 2 * (v1 + v2)
-            self.theta += 1 / l * dt * (v2 - v1)
+            method = self.robot.scene.integrator
+            subDt = self.robot.scene.integratorDt
+            if method == integrator.EULER and subDt is None:
+                self.x += math.cos(self.theta) * dt / 2 * (v1 + v2)
+                self.y += math.sin(self.theta) * dt / 2 * (v1 + v2)
+                self.theta += 1 / l * dt * (v2 - v1)
+            else:
+                x, y, theta = integrator.propagate(self.x, self.y, self.theta, 
+                                                   v1, v2, l, dt, method, subDt)
+                self.x = float(x)
+                self.y = float(y)
+                self.theta = float(theta)
             
             
     def transform(self):
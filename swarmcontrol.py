@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:20:41 2026
+
+Batched version of the distance-based formation controller in Robot.control
+(dynamics 15 - 18). All robots are handled in one numpy pass over the
+SwarmState arrays and the result is the same (v1, v2) as the per-robot code,
+bit for bit and in the same type (see swarmstate.py); set
+Scene.swarmControlCheck to compare the two on every step.
+
+Arrays may carry leading episode dimensions, i.e. (N,) or (E, N). Scene
+quantities that differ per episode (alpha, dpbarx, dpbary) are then given
+with shape (E, 1).
+
+@author: cz
+"""
+
+import numpy as np
+import robot as rb
+from swarmstate import commonType, cast, power
+
+ROLE_LEADER = 0
+ROLE_FOLLOWER = 1
+ROLE_PEER = 2
+
+vm = 0.7 # wheel's max linear speed in m/s
+
+def getGains(roles):
+    # Gains K1, K2, K3 and the saturation limit for each robot, as in
+    # Robot.control (K1 and K2 are integers there)
+    roles = np.asarray(roles)
+    K1 = np.where(roles == ROLE_FOLLOWER, 0, 1)
+    K2 = np.where(roles == ROLE_PEER, 0, 1)
+    K3 = np.where(roles == ROLE_PEER, 0.15, 0.0)
+    dxypMax = np.where(roles == ROLE_PEER, 0.7, float('inf'))
+    return K1, K2, K3, dxypMax
+
+def getDistances(pijx, pijy, adjMatrix):
+    # Distances to the neighbors as State.distancepTo computes them, inf for
+    # the others. Only the entries that can be selected below are computed
+    # with scalar powers: those within 1.414 times the second nearest
+    # distance, found with sqrt and a margin for its last-bit difference.
+    approx = np.sqrt(pijx * pijx + pijy * pijy)
+    approx = np.where(adjMatrix != 0, approx, np.inf)
+    if approx.shape[-1] < 2:
+        raise Exception('Every robot needs at least two neighbors!')
+    second = np.partition(approx, 1, axis = -1)[..., 1:2]
+    margin = 1 + 16 * np.finfo(approx.dtype).eps
+    candidates = (approx <= 1.414 * second * margin) & ~np.isinf(approx)
+    dist = np.full(approx.shape, np.inf, dtype = approx.dtype)
+    dist[candidates] = power(power(pijx[candidates], 2) +
+                             power(pijy[candidates], 2), 0.5)
+    return dist
+
+def getCandidateDistances(xi, candidates):
+    # Distances to the candidate neighbors of every robot, given in CSR
+    # form (indptr, indices) like the adjacency of the scene, e.g. from the
+    # spatial index, computed like getDistances. Returns the candidates of every robot in ascending
+    # order and their distances, both padded with the robot itself at
+    # distance inf to the largest number of candidates.
+    indptr, cols = candidates
+    n = len(xi.xp)
+    counts = np.diff(indptr)
+    rows = np.repeat(np.arange(n), counts)
+    m = max(int(counts.max()) if n > 0 else 0, 2)
+    valid = np.arange(m) < counts[:, None]
+    columns = np.repeat(np.arange(n)[:, None], m, axis = 1)
+    columns[valid] = cols
+    pijx = xi.xp[rows] - xi.xp[cols]
+    pijy = xi.yp[rows] - xi.yp[cols]
+    pij0 = power(power(pijx, 2) + power(pijy, 2), 0.5)
+    dist = np.full((n, m), np.inf, dtype = pij0.dtype)
+    dist[valid] = pij0
+    return columns, dist
+
+def selectNeighbors(dist):
+    # Sort neighbors by distance and keep the two nearest ones plus all those
+    # closer than 1.414 times the second nearest distance.
+    # Returns the sort order and a mask over the sorted columns, both cut to
+    # the largest number of selected neighbors.
+    order = np.argsort(dist, axis = -1, kind = 'stable')
+    lsd = np.take_along_axis(dist, order, axis = -1)
+    if np.any(np.isinf(lsd[..., 1])):
+        raise Exception('Every robot needs at least two neighbors!')
+    mask = lsd < 1.414 * lsd[..., 1:2]
+    mask[..., 0:2] = True
+    mask &= ~np.isinf(lsd)
+    # the selected neighbors are the first ones of each row
+    m = np.max(np.sum(mask, axis = -1))
+    return order[..., 0:m], mask[..., 0:m]
+
+def control(xi, xid, adjMatrix, roles, dynamics, alpha, dpbarx, dpbary,
+            candidates = None):
+    # xi, xid: SwarmState of the actual and the desired states, already transformed
+    # candidates: None to select the neighbors among all pairs, or those
+    # that can be selected in CSR form (indptr, indices), with indices sorted
+    # in each row (no leading episode dimensions then)
+    # Returns the linear speeds (v1, v2) of the two wheels of every robot.
+    # Every step follows Robot.control operation by operation, including
+    # its types, so that the result is the same to the last bit.
+    K1, K2, K3, dxypMax = getGains(roles)
+
+    # p' displacements and distances of the selected neighbors in sorted order
+    if candidates is None:
+        pijx = xi.xp[..., :, None] - xi.xp[..., None, :]
+        pijy = xi.yp[..., :, None] - xi.yp[..., None, :]
+        dist = getDistances(pijx, pijy, adjMatrix)
+        order, mask = selectNeighbors(dist)
+        j = order[mask]
+    else:
+        columns, dist = getCandidateDistances(xi, candidates)
+        order, mask = selectNeighbors(dist)
+        j = np.take_along_axis(columns, order, axis = -1)[mask]
+    pij0 = np.take_along_axis(dist, order, axis = -1)[mask]
+    # (..., i) of every selected pair and (..., j)
+    index = np.nonzero(mask)[:-1]
+    indexJ = index[:-1] + (j,)
+    pijx = xi.xp[index] - xi.xp[indexJ]
+    pijy = xi.yp[index] - xi.yp[indexJ]
+    if dynamics == 18:
+        alpha = np.asarray(alpha)
+        pijd0 = np.broadcast_to(alpha[..., None], mask.shape)[mask]
+    else:
+        pijdx = xid.xp[index] - xid.xp[indexJ]
+        pijdy = xid.yp[index] - xid.yp[indexJ]
+        pijd0 = power(power(pijdx, 2) + power(pijdy, 2), 0.5)
+
+    # Gradient terms of the selected neighbors, summed in sorted order
+    dtype = commonType(pij0, pijd0)
+    tauij0 = 2 * (cast(power(pij0, 4), dtype) - cast(power(pijd0, 4), dtype))
+    tauij0 = tauij0 / cast(power(pij0, 3), dtype)
+    tauij = np.zeros(mask.shape, dtype = dtype)
+    tauij[mask] = tauij0 * cast(pijx, dtype) / cast(pij0, dtype)
+    tauix = tauij[..., 0]
+    for k in range(1, mask.shape[-1]):
+        tauix = tauix + tauij[..., k]
+    tauij[mask] = tauij0 * cast(pijy, dtype) / cast(pij0, dtype)
+    tauiy = tauij[..., 0]
+    for k in range(1, mask.shape[-1]):
+        tauiy = tauiy + tauij[..., k]
+
+    # Achieve and keep formation
+    vxp = -cast(K3, dtype) * tauix
+    vyp = -cast(K3, dtype) * tauiy
+
+    # Velocity control toward goal, limit magnitude
+    dxp = np.asarray(dpbarx)
+    dyp = np.asarray(dpbary)
+    dxyp = power(power(dxp, 2) + power(dyp, 2), 0.5)
+    dxp = np.broadcast_to(dxp, vxp.shape)
+    dyp = np.broadcast_to(dyp, vyp.shape)
+    dxyp = np.broadcast_to(dxyp, vxp.shape)
+    dxypMax = cast(dxypMax, dxyp.dtype)
+    over = dxyp > dxypMax
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        dxp = np.where(over, dxp / dxyp * dxypMax, dxp)
+        dyp = np.where(over, dyp / dxyp * dxypMax, dyp)
+    dtype = commonType(vxp, dxp)
+    vxp = cast(vxp, dtype) + cast(cast(-K1, dxp.dtype) * dxp, dtype)
+    vyp = cast(vyp, dtype) + cast(cast(-K1, dyp.dtype) * dyp, dtype)
+
+    # Take goal's speed into account
+    dtype = commonType(vxp, xid.vxp)
+    vxp = cast(vxp, dtype) + cast(cast(K2, xid.vxp.dtype) * xid.vxp, dtype)
+    vyp = cast(vyp, dtype) + cast(cast(K2, xid.vyp.dtype) * xid.vyp, dtype)
+
+    # Feedback linearization, sin and cos in double precision like math
+    kk = 1
+    theta = cast(xi.theta, np.float64)
+    sinTheta = np.sin(theta)
+    cosTheta = np.cos(theta)
+    M11 = cast(kk * sinTheta + cosTheta, dtype)
+    M12 = cast(-kk * cosTheta + sinTheta, dtype)
+    M21 = cast(-kk * sinTheta + cosTheta, dtype)
+    M22 = cast(kk * cosTheta + sinTheta, dtype)
+    v1 = M11 * vxp + M12 * vyp
+    v2 = M21 * vxp + M22 * vyp
+    return saturateWheels(v1, v2)
+
+def saturateWheels(v1, v2):
+    # Scale both wheels so that neither exceeds vm, as in Robot.control,
+    # where the factor is a Python float
+    vMax = cast(np.maximum(np.fabs(v1), np.fabs(v2)), np.float64)
+    with np.errstate(divide = 'ignore'):
+        alpha = np.where(vMax > vm, vm / vMax, 1.0)
+    return cast(alpha, v1.dtype) * v1, cast(alpha, v2.dtype) * v2
+
+def limitAcceleration(v1, v2, v1Desired, v2Desired, dt):
+    # Batched version of the (deprecated) acceleration limit in Robot.control
+    if not rb.LIMIT_MAX_ACC:
+        return v1, v2
+    dvMax = rb.accMax * dt
+    dv1 = v1 - v1Desired
+    dv2 = v2 - v2Desired
+    v1 = np.where(dv1 > dvMax, v1Desired + dvMax,
+                  np.where(dv1 < -dvMax, v1Desired - dvMax, v1))
+    v2 = np.where(dv2 > dvMax, v2Desired + dvMax,
+                  np.where(dv2 < -dvMax, v2Desired - dvMax, v2))
+    return v1, v2
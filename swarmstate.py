@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:02:10 2026
+
+Structure-of-arrays counterpart of State. One SwarmState holds the same
+quantities as a list of State objects (x, y, theta, xp, yp, vxp, vyp) in
+contiguous numpy arrays, so that propagate() and transform() run as single
+batched updates instead of once per robot.
+
+The arrays may have shape (N,) for one scene or (E, N) for E episodes that
+are stepped together; every update below is elementwise.
+
+The arrays follow the types of the per-robot code so that both give the
+same bits: values that are np.float32 there (the drivers pass float32
+formations) are float32 arrays, Python floats are float64 arrays, and a
+Python float that meets a float32 is rounded to float32 first (NEP 50), see
+commonType(). Powers go through power(), math functions are taken in
+float64 like math.cos.
+
+@author: cz
+"""
+
+import numpy as np
+import integrator
+
+def commonType(*arrays):
+    # Result type of the per-robot code for these operands: float32 as soon
+    # as one of them is float32, since the others are Python floats there
+    for array in arrays:
+        if np.asarray(array).dtype == np.float32:
+            return np.float32
+    return np.float64
+
+def cast(array, dtype):
+    return np.asarray(array).astype(dtype, copy = False)
+
+def power(x, p):
+    # x**p on every element as on a scalar (libm pow), which numpy's sqrt
+    # and vectorized power do not match to the last bit
+    x = np.asarray(x)
+    if x.dtype == np.float32:
+        values = [v**p for v in x.ravel()]
+    else:
+        values = [v**p for v in x.ravel().tolist()]
+    return np.array(values, dtype = x.dtype).reshape(x.shape)
+
+def toScalars(array):
+    # np.float32 scalars for float32 arrays, Python floats otherwise
+    if array.dtype == np.float32:
+        return list(array)
+    return array.tolist()
+
+class SwarmState():
+    def __init__(self, n, dynamics, l = 0.331):
+        self.dynamics = dynamics
+        self.l = l # wheel base, same for every robot
+        self.x = np.zeros(n)
+        self.y = np.zeros(n)
+        self.theta = np.zeros(n)
+        self.xp = np.zeros(n) # x prime, updated in transform()
+        self.yp = np.zeros(n) # y prime, updated in transform()
+        self.vxp = np.zeros(n) # vx prime, updated in controller
+        self.vyp = np.zeros(n) # vy prime, updated in controller
+
+    @classmethod
+    def fromStates(cls, states, transformed = False):
+        # Build the arrays from a list of State objects that share one robot type
+        robot = states[0].robot
+        swarm = cls(len(states), robot.dynamics, robot.l)
+        swarm.gather(states, transformed)
+        return swarm
+
+    def __len__(self):
+        return self.x.shape[-1]
+
+    def gather(self, states, transformed = False):
+        # Copy x, y, theta and the transformed velocity out of the State
+        # objects, and xp, yp as well if they are transformed already
+        names = ['x', 'y', 'theta', 'vxp', 'vyp']
+        if transformed:
+            names += ['xp', 'yp']
+        for name in names:
+            values = np.array([getattr(state, name) for state in states])
+            array = getattr(self, name)
+            dtype = commonType(values)
+            if array.dtype != dtype:
+                array = array.astype(dtype)
+                setattr(self, name, array)
+            array[...] = values
+
+    def scatter(self, states):
+        # Write the arrays back so that plots and data recording keep working;
+        # float32 values are written as np.float32 like the per-robot code has
+        x = toScalars(self.x)
+        y = toScalars(self.y)
+        theta = toScalars(self.theta)
+        xp = toScalars(self.xp)
+        yp = toScalars(self.yp)
+        for i in range(len(states)):
+            states[i].x = x[i]
+            states[i].y = y[i]
+            states[i].theta = theta[i]
+            states[i].xp = xp[i]
+            states[i].yp = yp[i]
+            states[i].thetap = theta[i]
+
+    def propagate(self, v1, v2, dt, method = integrator.EULER, subDt = None):
+        # Batched version of State.propagate, v1 and v2 have the shape of x
+        if self.dynamics == 5:
+            self.x += v1 * dt
+            self.y += v2 * dt
+            self.theta[...] = 0 # useless
+        elif self.dynamics >= 10 and method == integrator.EULER and subDt is None:
+            dtype = commonType(v1, v2)
+            theta = cast(self.theta, np.float64)
+            dx = cast(np.cos(theta) * dt / 2, dtype) * (v1 + v2)
+            dy = cast(np.sin(theta) * dt / 2, dtype) * (v1 + v2)
+            dtheta = 1 / self.l * dt * (v2 - v1)
+            self.x = cast(self.x, commonType(self.x, dx)) + dx
+            self.y = cast(self.y, commonType(self.y, dy)) + dy
+            self.theta = cast(self.theta, commonType(self.theta, dtheta)) + dtheta
+        elif self.dynamics >= 10:
+            x, y, theta = integrator.propagate(self.x, self.y, self.theta,
+                                               v1, v2, self.l, dt, method, subDt)
+            # Python floats in State.propagate
+            self.x = cast(x, np.float64)
+            self.y = cast(y, np.float64)
+            self.theta = cast(theta, np.float64)
+
+    def transform(self):
+        # For feedback linearization, batched version of State.transform
+        if self.dynamics == 5:
+            self.xp[...] = self.x
+            self.yp[...] = self.y
+            self.theta[...] = 0 # useless
+        elif self.dynamics >= 10:
+            c = self.l / 2
+            theta = cast(self.theta, np.float64)
+            self.xp = self.x + cast(c * np.cos(theta), self.x.dtype)
+            self.yp = self.y + cast(c * np.sin(theta), self.y.dtype)
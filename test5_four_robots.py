@@ -175,62 +175,54 @@ def generateData(i):
 
 
 
+def generateDataBatch(numRun, seed):
+    # All numRun episodes of generateData() advanced at once, without a
+    # Scene per episode. Episode i is drawn after random.seed(seed + i) like
+    # runner.runEpisode(). Only obs2 and actions are recorded, there is no
+    # sensor offline.
+    formation = np.float32([[0.0, 0.0, 0.0], [-1.0, 0.0, 0.0],
+                            [-1.0/2, 1.732/2, 0.0], [1.0/2, 1.732/2, 0.0]])
+    adjMatrix = np.uint8([[0, 1, 1, 1], 
+                          [1, 0, 1, 1], 
+                          [1, 1, 0, 1],
+                          [1, 1, 1, 0]])
+    bs = BatchSimulator(numRun, formation, adjMatrix, dynamics = 18,
+                        dt = 0.01, recordData = True)
+    bs.reset(radius = 2, vRefMag = 0.5, alphaList = [1.5], seed = seed)
+    tf = 15
+    bs.run(tf)
+    return bs
+
 # main
-import saver
+import runner
+import data
+from recorder import ShardRecorder
+from batchsim import BatchSimulator
 numRun = 10
-dataList = []
-
-
-for i in range(0, numRun):
-    print('Run #: ', i, '...')
-    # First episode
-    sc0 = generateData(i)
-    if sc0 is not None:
-        # if the list is not empty
-        sc = sc0
-        saver.save(sc) # save data
-        if not dataList:
-            for robot in sc.robots:
-                dataList.append(robot.data)
-        else:
-            for j in range(len(sc.robots)):
-                dataList[j].append(sc.robots[j].data)
-        
-
-for j in range(1, len(sc.robots)):
-    dataList[0].append(dataList[j])
-dataList[0].store()
-
-#for j in range(len(sc.robots)):
-#    dataList[j].store()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+numWorkers = None # all cores
+useBatchSimulator = False # offline episodes in one BatchSimulator, see generateDataBatch()
+checkBatchSimulator = False # compare episode 0 with a Scene run of generateData()
+seed = None
+
+if __name__ == '__main__':
+    # Rows are written in shards while the episodes run; recorder.load()
+    # reads them back in the layout of runner.mergeData()
+    path = data.shardDirectory(0)
+    rec = ShardRecorder(path)
+    if useBatchSimulator:
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**31)
+        print('Base seed: ', seed)
+        bs = generateDataBatch(numRun, seed)
+        if checkBatchSimulator:
+            # seeded like runner.runEpisode()
+            random.seed(seed)
+            np.random.seed(seed % 2**32)
+            bs.checkEpisode(0, generateData(0))
+        for i in range(numRun):
+            for j, d in enumerate(bs.getData(i)):
+                rec.add(d, j)
+    else:
+        runner.streamEpisodes(generateData, numRun, rec, numWorkers, seed)
+    rec.close()
+    print("Training data of length {0:d} saved to ".format(rec.rows) + path)
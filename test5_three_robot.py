@@ -193,62 +193,17 @@ def generateData(i):
 
 
 # main
-import saver
+import runner
+import data
+from recorder import ShardRecorder
 numRun = 1
-dataList = []
-
-sc = None
-
-for i in range(0, numRun):
-    print('Run #: ', i, '...')
-    # First episode
-    sc0 = generateData(i)
-    if sc0 is not None:
-        # if the list is not empty
-        sc = sc0
-        saver.save(sc) # save data
-        if not dataList:
-            for robot in sc.robots:
-                dataList.append(robot.data)
-        else:
-            for j in range(len(sc.robots)):
-                dataList[j].append(sc.robots[j].data)
-        
-if sc:
-    for j in range(1, len(sc.robots)):
-        dataList[0].append(dataList[j])
-    dataList[0].store()
-
-#for j in range(len(sc.robots)):
-#    dataList[j].store()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+numWorkers = 1 # one vrep instance
+
+if __name__ == '__main__':
+    # Rows are written in shards while the episodes run; recorder.load()
+    # reads them back in the layout of runner.mergeData()
+    path = data.shardDirectory(0)
+    rec = ShardRecorder(path)
+    runner.streamEpisodes(generateData, numRun, rec, numWorkers)
+    rec.close()
+    print("Training data of length {0:d} saved to ".format(rec.rows) + path)
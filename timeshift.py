@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:07:26 2026
+
+Time-shift transform of recorded data for DeepFCL2: every sample i of an
+episode is paired with sample i + dk of the same episode, giving the
+observation pair [obs_i, obs_{i+dk}], the action a_i ('actions') and the
+action a_{i+dk} ('actions_1'). The last dk samples of every episode have no
+partner and are dropped.
+
+The pairs are described by two index arrays built in one pass from the
+episode starts. timeShift() gathers them into preallocated arrays and
+timeShiftLazy() returns columns that gather only the rows of a minibatch.
+
+@author: cz
+"""
+
+import numpy as np
+
+def getShiftIndices(epi_starts, dk = 1):
+    # Index arrays (i0, i1 = i0 + dk) of all pairs and the epi_starts of the
+    # pairs (True at the first pair of every episode)
+    epi_starts = np.asarray(epi_starts[:], dtype = bool)
+    n = len(epi_starts)
+    starts = np.flatnonzero(epi_starts)
+    if n > 0 and (len(starts) == 0 or starts[0] != 0):
+        starts = np.concatenate(([0], starts)) # rows before the first start
+    ends = np.append(starts[1:], n)
+    lengths = np.maximum(ends - starts - dk, 0)
+    offsets = np.cumsum(lengths) - lengths # first pair of every episode
+    total = int(np.sum(lengths))
+    i0 = np.arange(total) + np.repeat(starts - offsets, lengths)
+    pairStarts = np.zeros(total, dtype = bool)
+    pairStarts[offsets[lengths > 0]] = True
+    return i0, i0 + dk, pairStarts
+
+class ShiftedColumn():
+    # column[index[k]] as row k, gathered when indexed
+    def __init__(self, column, index):
+        self.column = column
+        self.index = index
+        self.dtype = column.dtype
+        self.shape = (len(index),) + tuple(column.shape[1:])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, batch):
+        return self.column[self.index[batch]]
+
+class PairedColumn():
+    # [column[i0[k]], column[i1[k]]] side by side as row k
+    def __init__(self, column, i0, i1):
+        self.column = column
+        self.i0 = i0
+        self.i1 = i1
+        self.dtype = column.dtype
+        self.shape = (len(i0), column.shape[1] * 2)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, batch):
+        return np.concatenate((self.column[self.i0[batch]],
+                               self.column[self.i1[batch]]), axis = -1)
+
+def timeShiftLazy(d, dk = 1):
+    # d: dict of arrays (np.load, dataset.Dataset, ...) with 'epi_starts',
+    # 'observations' and 'actions'
+    i0, i1, pairStarts = getShiftIndices(d['epi_starts'], dk)
+    return {'epi_starts': pairStarts,
+            'observations': PairedColumn(d['observations'], i0, i1),
+            'actions': ShiftedColumn(d['actions'], i0),
+            'actions_1': ShiftedColumn(d['actions'], i1)}
+
+def timeShift(d, dk = 1, chunkRows = 4096):
+    # Same as timeShiftLazy() but gathered into arrays, chunkRows pairs at a
+    # time. The dtypes are those the old np.append loop gave (int8 / float32
+    # promoted with the input).
+    i0, i1, pairStarts = getShiftIndices(d['epi_starts'], dk)
+    total = len(i0)
+    observationsIn = d['observations']
+    actionsIn = d['actions']
+    lenObservation = observationsIn.shape[1]
+    observations = np.empty((total, lenObservation * 2),
+                            dtype = np.result_type(np.int8, observationsIn.dtype))
+    actions = np.empty((total, 2), dtype = np.result_type(np.float32, actionsIn.dtype))
+    actions_1 = np.empty_like(actions)
+    for start in range(0, total, chunkRows):
+        end = min(start + chunkRows, total)
+        observations[start:end, 0:lenObservation] = observationsIn[i0[start:end]]
+        observations[start:end, lenObservation:] = observationsIn[i1[start:end]]
+        actions[start:end] = actionsIn[i0[start:end]]
+        actions_1[start:end] = actionsIn[i1[start:end]]
+    return {'epi_starts': pairStarts,
+            'observations': observations,
+            'actions': actions,
+            'actions_1': actions_1}
@@ -2,19 +2,26 @@
 """
 Created on Tue Apr  3 15:31:06 2018
 
+Merge recorded data sets (.npz files from Data.store or recorder shard
+directories) into one. The keys and column shapes are checked first and
+every column is then copied chunk by chunk, see dataset.merge(). A
+fileNameNew ending with .npz gives an uncompressed .npz, anything else a
+directory of memory-mapped .npy shards for dataset.Dataset.
+
 @author: cz
 """
 
-import numpy as np
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dataset
+
+fileNames = ["data1.npz", "data2.npz"]
+fileNameNew = "data3.npz"
 
-fileName1 = "data1.npz"
-fileName2 = "data2.npz"
-fileNameNew = "data3"
-data1 = np.load(fileName1)
-data2 = np.load(fileName2)
-dataNew = dict()
-for key in data1.keys():
-    print(key, ": ", data1[key].shape, ", ", data2[key].shape)
-    dataNew[key] =  np.append(data1[key], data2[key], axis = 0)
-    print(key, ": ", dataNew[key].shape)
-np.savez(fileNameNew, **(dataNew))
\ No newline at end of file
+if __name__ == '__main__':
+    parts, dtypes, shapes = dataset.getSchema(fileNames)
+    for key in parts:
+        print(key, ": ", [part[0] for part in parts[key]], " -> ", shapes[key], dtypes[key])
+    rows = dataset.merge(fileNames, fileNameNew)
+    print("Merged data of length {0:d} saved to ".format(rows) + fileNameNew)